@@ -0,0 +1,12 @@
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+
+
+@lru_cache(maxsize=None)
+def get_redis() -> redis.Redis:
+    """
+    Return a shared Redis client for the buffers and counters kept outside the cache.
+    """
+    return redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
@@ -1,5 +1,6 @@
 import os
 import sys
+import tempfile
 from pathlib import Path
 
 from celery.schedules import crontab
@@ -258,9 +259,33 @@ CELERY_BEAT_SCHEDULER = "redbeat.RedBeatScheduler"
 # CELERYBEAT_SCHEDULE_FILENAME = config(
 #     'CELERYBEAT_SCHEDULE_FILENAME', default='/data/celerybeat-schedule.db')
 CELERY_BEAT_SCHEDULE = {
-    "check-email-statuses-every-hour": {
+    # The tracking webhook updates the statuses, polling only reconciles lost calls
+    "check-email-statuses-every-6-hours": {
         "task": "infrastructure.tasks.check_email_statuses",
-        "schedule": crontab(minute=0, hour="*"),
+        "schedule": crontab(minute=0, hour="*/6"),
+    },
+    # Picks up queued email events if a scheduled run was lost
+    "process-email-events-every-minute": {
+        "task": "infrastructure.tasks.process_email_events",
+        "schedule": crontab(minute="*"),
+    },
+    "flush-filter-usage-every-minute": {
+        "task": "infrastructure.tasks.flush_filter_usage_counts",
+        "schedule": crontab(minute="*"),
+    },
+    "aggregate-project-set-views-every-minute": {
+        "task": "infrastructure.tasks.aggregate_project_set_views",
+        "schedule": crontab(minute="*"),
+    },
+    # Picks up queued projects if a scheduled run of the indexing outbox was lost
+    "process-indexing-outbox-every-minute": {
+        "task": "infrastructure.tasks.process_indexing_outbox",
+        "schedule": crontab(minute="*"),
+    },
+    # Fails the import jobs whose worker died, so their page stops polling
+    "fail-stale-import-jobs-every-10-minutes": {
+        "task": "infrastructure.tasks.fail_stale_import_jobs",
+        "schedule": crontab(minute="*/10"),
     },
 }
 
@@ -279,6 +304,19 @@ ANYMAIL = {
     "MAILGUN_API_KEY": f"{config('MALIGUN_API_KEY')}",
     "MAILGUN_SENDER_DOMAIN": f"{config('MALIGUN_SUBDOMAIN')}",
 }
+# Signs the tracking webhook calls, the webhook URL is only routed once it is set
+MAILGUN_WEBHOOK_SIGNING_KEY = config("MAILGUN_WEBHOOK_SIGNING_KEY", default=None)
+if MAILGUN_WEBHOOK_SIGNING_KEY:
+    ANYMAIL["MAILGUN_WEBHOOK_SIGNING_KEY"] = MAILGUN_WEBHOOK_SIGNING_KEY
+# Basic auth credentials ("user:password") of the tracking webhook URL
+ANYMAIL_WEBHOOK_SECRET = config("ANYMAIL_WEBHOOK_SECRET", default=None)
+if ANYMAIL_WEBHOOK_SECRET:
+    ANYMAIL["WEBHOOK_SECRET"] = ANYMAIL_WEBHOOK_SECRET
+EMAIL_EVENTS_DELAY = 5  # seconds to coalesce webhook events before applying them
+MAILGUN_TIMEOUT = 10  # seconds per request to the Mailgun API
+MAILGUN_POLL_THREADS = 4
+MAILGUN_EVENTS_WINDOW = 60 * 60 * 6  # seconds of events fetched per thread
+EMAIL_STATUS_MAX_AGE = 30  # days an email status is polled for
 DEFAULT_FROM_EMAIL = f"mailgun@{config('MALIGUN_SUBDOMAIN')}"
 SERVER_EMAIL = f"mailgun@{config('MALIGUN_SUBDOMAIN')}"
 
@@ -295,7 +333,38 @@ ELASTICSEARCH_DSL = {
     "test": {"hosts": "http://elasticsearch_test:9200"},
 }
 DEFAULT_SIZE_PAGE = 10
+INDEXING_CHUNK_SIZE = config("INDEXING_CHUNK_SIZE", default=1000, cast=int)
+IMPORT_BATCH_SIZE = config("IMPORT_BATCH_SIZE", default=500, cast=int)
+# Rendered project set PDFs, keyed by the set and a hash of its content
+PDF_CACHE_DIR = config("PDF_CACHE_DIR", default="/data/pdfs")
+PDF_RENDER_TIMEOUT = 60  # seconds a queued render blocks queueing another one
+EXPORT_CHUNK_SIZE = config("EXPORT_CHUNK_SIZE", default=1000, cast=int)
+# Uploaded CSVs are stored here until their import job has run
+IMPORT_FILES_DIR = config("IMPORT_FILES_DIR", default="/data/imports")
+IMPORT_JOB_TIMEOUT = config(
+    "IMPORT_JOB_TIMEOUT", default=60 * 60, cast=int
+)  # seconds after which a pending or running import job is considered lost
+INDEXING_OUTBOX_DELAY = config(
+    "INDEXING_OUTBOX_DELAY", default=2, cast=int
+)  # seconds to coalesce project writes before indexing them
+FACETS_CACHE_TIMEOUT = config(
+    "FACETS_CACHE_TIMEOUT", default=60 * 60 * 24, cast=int
+)  # 1 day in seconds by default, entries are invalidated on project writes
+SEARCH_RESULTS_CACHE_TIMEOUT = config(
+    "SEARCH_RESULTS_CACHE_TIMEOUT", default=60, cast=int
+)
+SHARED_SET_PAGE_CACHE_TIMEOUT = config(
+    "SHARED_SET_PAGE_CACHE_TIMEOUT", default=60 * 60, cast=int
+)
 DEFAULT_FIRST_PAGE = 1
+PROJECT_SETS_LINKS_MAX_SIZE_PAGE = 100
+SEARCH_MAX_SIZE_PAGE = 100
+# Deeper pages are only reachable through the page token (search_after)
+SEARCH_MAX_OFFSET_RESULTS = config("SEARCH_MAX_OFFSET_RESULTS", default=1000, cast=int)
+SEARCH_POINT_IN_TIME_KEEP_ALIVE = config(
+    "SEARCH_POINT_IN_TIME_KEEP_ALIVE", default="5m"
+)
+SEARCH_PAGINATION_WINDOW = 5
 
 LINKEDIN_CLIENT_ID = config("SOCIAL_AUTH_LINKEDIN_OAUTH2_KEY")
 LINKEDIN_CLIENT_SECRET = config("SOCIAL_AUTH_LINKEDIN_OAUTH2_SECRET")
@@ -322,6 +391,10 @@ elif CONFIGURATION == "testing":
 
     CELERY_BROKER_URL = "redis://"
     CELERY_RESULT_BACKEND = "redis://"
+    CELERY_TASK_ALWAYS_EAGER = True
+
+    IMPORT_FILES_DIR = os.path.join(tempfile.gettempdir(), "imports")
+    PDF_CACHE_DIR = os.path.join(tempfile.gettempdir(), "pdfs")
 
     PASSWORD_HASHERS = [
         "django.contrib.auth.hashers.MD5PasswordHasher",
@@ -334,5 +407,7 @@ elif CONFIGURATION == "testing":
     }
 
     EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
+    MAILGUN_WEBHOOK_SIGNING_KEY = "test-signing-key"
+    ANYMAIL["MAILGUN_WEBHOOK_SIGNING_KEY"] = MAILGUN_WEBHOOK_SIGNING_KEY
     DEFAULT_FROM_EMAIL = "test@test.com"
     ELASTICSEARCH_DSL["default"] = ELASTICSEARCH_DSL["test"]
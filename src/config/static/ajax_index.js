@@ -315,16 +315,24 @@ document.addEventListener('DOMContentLoaded', function () {
         urlParams.delete('technology');
         technologies.forEach(tech => urlParams.append('technology', tech));
 
+        // A page token belongs to the previous query
+        urlParams.delete('page_token');
+
         window.history.replaceState({}, '', `${window.location.pathname}?${urlParams.toString()}`);
 
         fetchProjects();
     };
 
-    const fetchProjects = (page = null) => {
+    const fetchProjects = (page = null, pageToken = null) => {
         const urlParams = new URLSearchParams(window.location.search);
         if (page) {
             urlParams.set('page', page);
         }
+        if (pageToken) {
+            urlParams.set('page_token', pageToken);
+        } else {
+            urlParams.delete('page_token');
+        }
 
         fetch(`${window.location.pathname}?${urlParams.toString()}`, {
             headers: {
@@ -378,8 +386,8 @@ document.addEventListener('DOMContentLoaded', function () {
         document.querySelectorAll('.page-link').forEach(link => {
             link.addEventListener('click', function (event) {
                 event.preventDefault();
-                const page = new URL(link.href).searchParams.get('page');
-                fetchProjects(page);
+                const linkParams = new URL(link.href).searchParams;
+                fetchProjects(linkParams.get('page'), linkParams.get('page_token'));
             });
         });
 
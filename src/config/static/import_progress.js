@@ -0,0 +1,47 @@
+document.addEventListener('DOMContentLoaded', function () {
+    const container = document.getElementById('importProgress');
+    if (!container) {
+        return;
+    }
+    const pollInterval = 2000;
+
+    function render(job) {
+        container.querySelectorAll('span[data-field]').forEach(function (element) {
+            element.textContent = job[element.getAttribute('data-field')];
+        });
+
+        const errors = container.querySelector('[data-field="errors"]');
+        errors.innerHTML = '';
+        job.errors.forEach(function (error) {
+            const item = document.createElement('li');
+            item.textContent = `Row ${error.row}: ${error.message}`;
+            errors.appendChild(item);
+        });
+
+        if (job.finished) {
+            const bar = container.querySelector('.progress-bar');
+            bar.classList.remove('progress-bar-animated', 'progress-bar-striped');
+            bar.classList.add(job.status === 'succeeded' ? 'bg-success' : 'bg-danger');
+        }
+    }
+
+    function poll() {
+        fetch(container.getAttribute('data-url'))
+            .then(response => response.json())
+            .then(data => {
+                if (data.status !== 'success') {
+                    return;
+                }
+                render(data.job);
+                if (!data.job.finished) {
+                    setTimeout(poll, pollInterval);
+                }
+            })
+            .catch(error => {
+                console.error('Error:', error);
+                setTimeout(poll, pollInterval * 2);
+            });
+    }
+
+    poll();
+});
@@ -15,6 +15,13 @@ urlpatterns = [
     path("", include("infrastructure.urls")),
 ]
 
+# Signed Mailgun tracking webhook: anymail/mailgun/tracking/
+# Without a signing key anymail would check the signatures against the API key
+if settings.ANYMAIL.get("MAILGUN_WEBHOOK_SIGNING_KEY"):
+    urlpatterns += [
+        path("anymail/", include("anymail.urls")),
+    ]
+
 # For debug mode only
 if settings.CONFIGURATION == "dev":
     # Turn on debug toolbar
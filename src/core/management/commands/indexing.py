@@ -1,17 +1,59 @@
-from django_elasticsearch_dsl.management.commands.search_index import (
-    Command as SearchIndexCommand,
-)
+from django.core.management.base import BaseCommand
 
+from config import settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the projects index into a new index and swap the alias to it, "
+        "so the search keeps working during the rebuild"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=settings.INDEXING_CHUNK_SIZE,
+            help="Documents per database chunk and bulk request",
+        )
+        parser.add_argument(
+            "--thread-count",
+            type=int,
+            default=4,
+            help="Threads sending bulk requests",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=2,
+            help="Processes building the documents",
+        )
+        parser.add_argument(
+            "--keep-indices",
+            type=int,
+            default=1,
+            help="Previous indices to keep for a rollback",
+        )
 
-class Command(SearchIndexCommand):
     def handle(self, *args, **options):
-        models = self._get_models(["infrastructure"])
+        from infrastructure.indexing import reindex_projects
 
-        # We need to know if and which aliases exist to mitigate naming
-        # conflicts with indices, therefore this is needed regardless
-        # of using the '--use-alias' arg.
-        aliases = []
-        for index in self.es_conn.indices.get_alias().values():
-            aliases += index["aliases"].keys()
+        def progress(indexed, errors, rate):
+            self.stdout.write(
+                f"Indexed {indexed} documents, {errors} errors ({rate:.0f} docs/sec)"
+            )
 
-        self._rebuild(models, aliases, options)
+        result = reindex_projects(
+            chunk_size=options["chunk_size"],
+            thread_count=options["thread_count"],
+            processes=options["processes"],
+            keep_indices=options["keep_indices"],
+            progress=progress,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Indexed {result['indexed']} documents into '{result['index']}' "
+                f"in {result['duration']:.1f}s, removed {result['deleted']} "
+                "documents of deleted projects"
+            )
+        )
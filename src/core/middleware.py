@@ -21,6 +21,8 @@ def is_restricted_internal_url(url):
         "/linkedin/login/",
         "/verify-email/",
         "/sets/",
+        # Webhooks, authenticated by their signature
+        "/anymail/",
     ]
     return not max([url.startswith(x) for x in URL_PREFIXES_EXCLUDES])
 
@@ -1,12 +1,13 @@
 import os
 
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
 from elasticsearch.helpers import bulk
 from rest_framework import status
 
 from accounts.tests.test_views import BaseViewTests
 from infrastructure.elastic import ProjectDocument
-from infrastructure.models import Project
+from infrastructure.models import ImportJob, Industry, Project, Technology
 
 
 class IndexViewTests(BaseViewTests):
@@ -18,12 +19,7 @@ class IndexViewTests(BaseViewTests):
             description="Test Description",
             url="http://example.com",
         )
-        projects_to_index = Project.objects.all()
-        actions = (
-            ProjectDocument.get_indexing_action(project)
-            for project in projects_to_index
-        )
-        bulk(self.es, actions)
+        bulk(self.es, ProjectDocument.get_indexing_actions(Project.objects.all()))
 
         self.es.indices.refresh(index=self.index_name)
 
@@ -35,6 +31,46 @@ class IndexViewTests(BaseViewTests):
         self.assertIn("results", response.context)
         self.assertEqual(response.context["total_results"], 1)
 
+    def test_index_view_overall_facets(self):
+        self.client.force_login(self.u1)
+        response = self.client.get(reverse("index"), {"q": "nothing matches this"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.context["total_results"], 0)
+        self.assertEqual(response.context["results"]["overall_project_count"], 1)
+
+    def test_index_view_page_token(self):
+        second_project = Project.objects.create(
+            user_id=self.u1.id,
+            title="Second Project",
+            description="Second Description",
+        )
+        bulk(self.es, [ProjectDocument.get_indexing_action(second_project)])
+        self.es.indices.refresh(index=self.index_name)
+
+        self.client.force_login(self.u1)
+        response = self.client.get(reverse("index"), {"size": 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.context["has_next_page"])
+        first_hit = response.context["results"]["data"][0]
+
+        response = self.client.get(
+            reverse("index"),
+            {"size": 1, "page_token": response.context["next_page_token"]},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.context["page"], 2)
+        self.assertFalse(response.context["has_next_page"])
+        second_hit = response.context["results"]["data"][0]
+        self.assertNotEqual(first_hit.meta.id, second_hit.meta.id)
+
+    def test_index_view_invalid_paging(self):
+        self.client.force_login(self.u1)
+        for params in ({"size": 0}, {"size": "many"}, {"size": -5, "page": -3}):
+            response = self.client.get(reverse("index"), params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.context["page"], 1)
+            self.assertEqual(response.context["total_results"], 1)
+
 
 class UploadCSVViewTests(BaseViewTests):
     def test_upload_csv_view_valid(self):
@@ -45,12 +81,45 @@ class UploadCSVViewTests(BaseViewTests):
         with open(csv_path, "w") as f:
             f.write(csv_content)
 
-        with open(csv_path, "rb") as f:
+        # The import job runs once the upload is committed, eagerly in tests
+        with open(csv_path, "rb") as f, self.captureOnCommitCallbacks(execute=True):
             response = self.client.post(reverse("upload_csv"), {"csv_file": f})
 
         os.remove(csv_path)
 
+        job = ImportJob.objects.get(created_by=self.u1)
         self.assertEqual(response.status_code, status.HTTP_302_FOUND)
-        self.assertRedirects(response, reverse("index"))
+        self.assertRedirects(response, f"{reverse('upload_csv')}?job={job.id}")
+        self.assertEqual(job.status, ImportJob.Status.SUCCEEDED)
+        self.assertEqual(job.created_count, 1)
+        self.assertEqual(job.indexed_count, 1)
+        self.assertFalse(os.path.exists(job.file_path))
         self.es.indices.refresh(index=self.index_name)
-        self.assertTrue(self.es.exists(index=self.index_name, id=1))
+        project = Project.objects.get(user=self.u1)
+        self.assertTrue(self.es.exists(index=self.index_name, id=project.id))
+
+    def test_upload_csv_view_resolves_tags_case_insensitively(self):
+        self.client.force_login(self.u1)
+        technology = Technology.objects.get(title="Kubernetes")
+        csv_content = (
+            "title;description;url;industries;technologies\n"
+            "First;Description;;Space Mining;kubernetes, Quantum Widgets\n"
+            "Second;Description;;space mining;KUBERNETES,quantum widgets\n"
+        )
+        upload = SimpleUploadedFile("projects.csv", csv_content.encode())
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("upload_csv"), {"csv_file": upload})
+
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(
+            Technology.objects.filter(title__iexact="kubernetes").count(), 1
+        )
+        self.assertEqual(
+            Technology.objects.filter(title__iexact="quantum widgets").count(), 1
+        )
+        self.assertEqual(
+            Industry.objects.filter(title__iexact="space mining").count(), 1
+        )
+        for project in Project.objects.filter(title__in=["First", "Second"]):
+            self.assertIn(technology, project.technologies.all())
+            self.assertEqual(project.industries.count(), 1)
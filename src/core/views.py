@@ -1,17 +1,22 @@
 from urllib.parse import urlencode
 
-import tablib
 from django.contrib import messages
 from django.shortcuts import redirect, render
 from django.urls import reverse
-from elasticsearch.helpers import bulk
 
 from config import settings
 from config.logging import log
 from core.forms import CSVUploadForm
-from infrastructure.admin import ProjectResource
-from infrastructure.elastic import ProjectDocument, search_projects
-from infrastructure.models import Project, FilterUsage
+from infrastructure.counters import record_filter_usage
+from infrastructure.elastic import search_projects
+from infrastructure.imports import create_import_job
+
+
+def _get_int_param(request, name: str, default: int) -> int:
+    try:
+        return int(request.GET.get(name, default))
+    except ValueError:
+        return default
 
 
 def index(request):
@@ -19,29 +24,29 @@ def index(request):
     search_string = request.GET.get("q")
     technologies = request.GET.getlist("technology")
     industries = request.GET.getlist("industry")
-    page = int(request.GET.get("page", settings.DEFAULT_FIRST_PAGE))
-    size = int(request.GET.get("size", settings.DEFAULT_SIZE_PAGE))
+    page = _get_int_param(request, "page", settings.DEFAULT_FIRST_PAGE)
+    size = max(
+        1,
+        min(
+            _get_int_param(request, "size", settings.DEFAULT_SIZE_PAGE),
+            settings.SEARCH_MAX_SIZE_PAGE,
+        ),
+    )
     sort_by = request.GET.get("sort_by")
+    page_token = request.GET.get("page_token")
+
+    # Page numbers are only used for shallow pages, deeper ones need a page token
+    max_offset_page = max(settings.SEARCH_MAX_OFFSET_RESULTS // size, 1)
+    page = min(max(page, 1), max_offset_page)
 
     log(
         "info",
         f"User {user.email} filtered projects with query: {search_string}, technologies: {technologies}, industries: {industries}, page: {page}, size: {size}, sort_by: {sort_by}",
     )
 
-    # Update filter usage statistics
-    for tech in technologies:
-        filter_usage, _ = FilterUsage.objects.get_or_create(
-            filter_type="technology", filter_value=tech
-        )
-        filter_usage.usage_count += 1
-        filter_usage.save()
-
-    for industry in industries:
-        filter_usage, _ = FilterUsage.objects.get_or_create(
-            filter_type="industry", filter_value=industry
-        )
-        filter_usage.usage_count += 1
-        filter_usage.save()
+    # Update filter usage statistics, buffered and flushed to the database periodically
+    record_filter_usage("technology", technologies)
+    record_filter_usage("industry", industries)
 
     results = search_projects(
         user=user,
@@ -51,11 +56,19 @@ def index(request):
         page=page,
         size=size,
         sort_by=sort_by,
+        page_token=page_token,
     )
 
-    total_results = results["data"].hits.total.value
+    page = results["page"]
+    total_results = results["total"]
     total_pages = (total_results + size - 1) // size  # Calculate total number of pages
-    has_next_page = page < total_pages  # Determine if there is a next page
+    # Only show a window of page numbers around the current page
+    last_numbered_page = min(
+        total_pages, max_offset_page, page + settings.SEARCH_PAGINATION_WINDOW
+    )
+    first_numbered_page = max(
+        1, min(page, last_numbered_page) - settings.SEARCH_PAGINATION_WINDOW
+    )
 
     # Manually build the query string, including all filter parameters
     query_params = {
@@ -81,8 +94,14 @@ def index(request):
         "page": page,
         "size": size,
         "total_results": total_results,
-        "page_range": (range(1, total_pages + 1) if total_pages > 1 else []),
-        "has_next_page": has_next_page,
+        "page_range": (
+            range(first_numbered_page, last_numbered_page + 1)
+            if total_pages > 1
+            else []
+        ),
+        "has_previous_page": 1 < page <= max_offset_page + 1,
+        "has_next_page": results["next_page_token"] is not None,
+        "next_page_token": results["next_page_token"],
         "query_params": query_string,
     }
 
@@ -93,45 +112,25 @@ def upload_csv(request):
     if request.method == "POST":
         form = CSVUploadForm(request.POST, request.FILES)
         if form.is_valid():
-            csv_file = request.FILES["csv_file"]
-            data = csv_file.read().decode("utf-8")
-            dataset = tablib.Dataset().load(data, format="csv", delimiter=";")
-
-            project_resource = ProjectResource()
-            result = project_resource.import_data(
-                dataset, dry_run=True, user_id=request.user.id
+            # Imported and indexed in the background, nothing is kept if any row fails
+            job = create_import_job(
+                request.FILES["csv_file"],
+                user_id=request.user.id,
+                created_by=request.user,
+                atomic=True,
+            )
+            messages.success(
+                request, "CSV file uploaded, the import is running in the background."
             )
-            log(f"Dry run result: {result.totals}")
-
-            if not result.has_errors():
-                result = project_resource.import_data(
-                    dataset, dry_run=False, user_id=request.user.id
-                )
-                log(f"Result: {result.totals}")
-                created_or_updated_ids = set()
-                for row_result in result.rows:
-                    if row_result.import_type in ("new", "update"):
-                        created_or_updated_ids.add(row_result.object_id)
-
-                # Bulk indexing of only newly created or updated projects
-                projects_to_index = Project.objects.filter(
-                    id__in=created_or_updated_ids
-                )
-                actions = (
-                    ProjectDocument.get_indexing_action(project)
-                    for project in projects_to_index
-                )
-                index_result = bulk(ProjectDocument._get_connection(), actions)
-                log(f"Indexing Result: {index_result}")
-                messages.success(
-                    request,
-                    "CSV file imported and indexed successfully! Created projects - %d, Updated projects - %d"
-                    % (result.totals["new"], result.totals["update"]),
-                )
-                return redirect(reverse("index"))
-            else:
-                messages.error(request, "CSV file import failed due to errors.")
+            return redirect(f"{reverse('upload_csv')}?{urlencode({'job': job.id})}")
     else:
         form = CSVUploadForm()
 
-    return render(request, "upload_csv.html", {"form": form})
+    job_id = request.GET.get("job")
+    context = {
+        "form": form,
+        "import_job_url": (
+            reverse("import_job", args=[job_id]) if job_id and job_id.isdigit() else None
+        ),
+    }
+    return render(request, "upload_csv.html", context)
@@ -0,0 +1,156 @@
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+import redis
+from django.db import transaction
+from django.db.models import F
+
+from config.logging import log
+from config.redis import get_redis
+
+from .counters import bulk_increment
+from .models import ProjectSet, ProjectSetLinkAccess
+
+PROJECT_SET_VIEWS_KEY = "project_sets:views"
+PROJECT_SET_VIEWS_LOCK_KEY = "project_sets:views:lock"
+# Oldest views are dropped if the aggregation stops running for a long time
+PROJECT_SET_VIEWS_MAX_LENGTH = 1_000_000
+PROJECT_SET_VIEWS_BATCH_SIZE = 1000
+
+
+def _visitors_key(project_set_id) -> str:
+    return f"project_sets:visitors:{project_set_id}"
+
+
+def record_project_set_view(project_set_id, ip_address_hash: str):
+    """
+    Append a view of a shared project set to a Redis stream, without touching the
+    database. The views are written to ProjectSetLinkAccess by
+    aggregate_project_set_views.
+    """
+    try:
+        get_redis().xadd(
+            PROJECT_SET_VIEWS_KEY,
+            {"project_set_id": project_set_id, "ip_address_hash": ip_address_hash},
+            maxlen=PROJECT_SET_VIEWS_MAX_LENGTH,
+            approximate=True,
+        )
+    except redis.RedisError as e:
+        # The page is served without its view rather than failing
+        log(f"Failed to record project set view: {e}", "warning")
+
+
+def aggregate_project_set_views() -> int:
+    """
+    Move the views recorded in the Redis stream to ProjectSetLinkAccess, in batches.
+
+    Returns:
+        int: The number of aggregated views.
+    """
+    client = get_redis()
+    aggregated = 0
+    # Views stay in the stream until applied, a parallel run would read them too
+    with client.lock(PROJECT_SET_VIEWS_LOCK_KEY, timeout=300, blocking_timeout=10):
+        while True:
+            entries = client.xrange(
+                PROJECT_SET_VIEWS_KEY, count=PROJECT_SET_VIEWS_BATCH_SIZE
+            )
+            if not entries:
+                break
+            _apply_views(
+                Counter(
+                    (int(fields["project_set_id"]), fields["ip_address_hash"])
+                    for _, fields in entries
+                )
+            )
+            client.xdel(PROJECT_SET_VIEWS_KEY, *(entry_id for entry_id, _ in entries))
+            aggregated += len(entries)
+    return aggregated
+
+
+def _new_visitors(visits: Iterable[Tuple[int, str]]) -> Dict[int, List[str]]:
+    """
+    Return the hashes of first time visitors per project set, using a Redis set
+    of visitor hashes per project set.
+    """
+    by_project_set = defaultdict(list)
+    for project_set_id, ip_address_hash in visits:
+        by_project_set[project_set_id].append(ip_address_hash)
+
+    client = get_redis()
+    pipeline = client.pipeline(transaction=False)
+    for project_set_id in by_project_set:
+        pipeline.exists(_visitors_key(project_set_id))
+    for project_set_id, is_seeded in zip(by_project_set, pipeline.execute()):
+        if is_seeded:
+            continue
+        # Seeded from the database the first time the set is seen
+        known = list(
+            ProjectSetLinkAccess.objects.filter(
+                project_set_id=project_set_id
+            ).values_list("ip_address_hash", flat=True)
+        )
+        if known:
+            client.sadd(_visitors_key(project_set_id), *known)
+
+    # Pipelined SISMEMBER calls, SMISMEMBER needs Redis 6.2
+    for project_set_id, ip_address_hashes in by_project_set.items():
+        for ip_address_hash in ip_address_hashes:
+            pipeline.sismember(_visitors_key(project_set_id), ip_address_hash)
+    is_known = iter(pipeline.execute())
+
+    new_visitors = {}
+    for project_set_id, ip_address_hashes in by_project_set.items():
+        new = [
+            ip_address_hash
+            for ip_address_hash in ip_address_hashes
+            if not next(is_known)
+        ]
+        if new:
+            new_visitors[project_set_id] = new
+    return new_visitors
+
+
+def _apply_views(views: Counter):
+    # Views of deleted sets are dropped
+    existing_ids = set(
+        ProjectSet.objects.filter(
+            id__in={project_set_id for project_set_id, _ in views}
+        ).values_list("id", flat=True)
+    )
+    views = Counter(
+        {visit: count for visit, count in views.items() if visit[0] in existing_ids}
+    )
+    if not views:
+        return
+
+    new_visitors = _new_visitors(views)
+
+    with transaction.atomic():
+        bulk_increment(
+            ProjectSetLinkAccess,
+            ("project_set_id", "ip_address_hash"),
+            views,
+            "view_count",
+        )
+        for project_set_id, ip_address_hashes in new_visitors.items():
+            ProjectSet.objects.filter(id=project_set_id).update(
+                shared_link_count=F("shared_link_count") + len(ip_address_hashes)
+            )
+
+    if new_visitors:
+        # Marked as known once counted, a failed batch counts them again
+        pipeline = get_redis().pipeline(transaction=False)
+        for project_set_id, ip_address_hashes in new_visitors.items():
+            pipeline.sadd(_visitors_key(project_set_id), *ip_address_hashes)
+        pipeline.execute()
+
+        from .tasks import send_open_notification_email
+
+        # One notification per set and batch, however many visitors opened it
+        for project_set in ProjectSet.objects.filter(
+            id__in=new_visitors
+        ).select_related("user"):
+            send_open_notification_email.delay(
+                project_set.user.email, project_set.title
+            )
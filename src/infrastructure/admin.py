@@ -1,20 +1,32 @@
+from collections import defaultdict
+
 import tablib
 from django import forms
 from django.contrib import admin, messages
-from django.http import HttpResponse
+from django.db.models.functions import Lower
+from django.http import HttpResponseRedirect, StreamingHttpResponse
 from django.template.response import TemplateResponse
-from elasticsearch.helpers import bulk
 from import_export import fields, resources, widgets
 from import_export.admin import ImportExportModelAdmin
 from import_export.formats.base_formats import CSV, TextFormat
 from import_export.forms import ImportForm
 from django.urls import reverse
+from django.utils.html import format_html
 
 from accounts.models import User
-from config.logging import log
-from infrastructure.elastic import ProjectDocument
+from infrastructure.exporters import iter_projects_csv
+from infrastructure.imports import create_import_job
+from infrastructure.outbox import enqueue_project_indexing
 
-from .models import Company, Industry, Project, ProjectSet, Technology, FilterUsage
+from .models import (
+    Company,
+    FilterUsage,
+    ImportJob,
+    Industry,
+    Project,
+    ProjectSet,
+    Technology,
+)
 
 
 class FiltersModelAdmin(admin.ModelAdmin):
@@ -31,6 +43,25 @@ class FiltersModelAdmin(admin.ModelAdmin):
 admin.site.register(FilterUsage, FiltersModelAdmin)
 
 
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "user",
+        "status",
+        "rows_processed",
+        "created_count",
+        "updated_count",
+        "error_count",
+        "indexed_count",
+        "created_at",
+        "finished_at",
+    )
+    list_filter = ("status",)
+    readonly_fields = ("errors",)
+    ordering = ("-created_at",)
+
+
 @admin.register(Company)
 class CompanyAdmin(admin.ModelAdmin):
     list_display = ("title",)
@@ -116,6 +147,12 @@ class ProjectResource(resources.ModelResource):
             "technologies",
         )
 
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # Tag ids by lowercase title, resolved for the whole dataset in before_import
+        self.technology_ids = {}
+        self.industry_ids = {}
+
     def get_import_id_fields(self):
         return ["user_id", "title"]
 
@@ -126,31 +163,87 @@ class ProjectResource(resources.ModelResource):
         dataset.append_col(
             [kwargs.get("user_id")] * dataset.__len__(), header="user_id"
         )
+        # Resolve all tags of the dataset at once, the rows are mapped from memory
+        self.technology_ids = self.resolve_tag_ids(
+            Technology, self.get_tag_titles(dataset, "technologies")
+        )
+        self.industry_ids = self.resolve_tag_ids(
+            Industry, self.get_tag_titles(dataset, "industries")
+        )
+
+    @staticmethod
+    def split_tags(value):
+        return [title.strip() for title in value.split(",") if title.strip()]
+
+    @classmethod
+    def get_tag_titles(cls, dataset, column):
+        if column not in (dataset.headers or []):
+            return set()
+        titles = set()
+        for value in dataset[column]:
+            if value:
+                titles.update(cls.split_tags(value))
+        return titles
+
+    @staticmethod
+    def resolve_tag_ids(model, titles):
+        """
+        Return the ids of the tags with the given titles, by lowercase title.
+        Matches titles case-insensitively with one query and creates the missing tags in bulk.
+        """
+        titles_by_key = {}
+        for title in titles:
+            titles_by_key.setdefault(title.lower(), title)
+        if not titles_by_key:
+            return {}
+
+        def lookup():
+            ids = {}
+            # Like .first() on a title__iexact lookup, duplicates resolve to the lowest id
+            for tag_id, title in (
+                model.objects.annotate(lower_title=Lower("title"))
+                .filter(lower_title__in=titles_by_key.keys())
+                .order_by("id")
+                .values_list("id", "lower_title")
+            ):
+                ids.setdefault(title, tag_id)
+            return ids
+
+        ids = lookup()
+        missing = [
+            model(title=title)
+            for key, title in titles_by_key.items()
+            if key not in ids
+        ]
+        if missing:
+            model.objects.bulk_create(missing)
+            ids = lookup()
+        return ids
 
     def before_import_row(self, row, row_number=None, **kwargs):
-        # Process technologies field: split by comma and get or create Technology objects
+        # Process technologies field: split by comma and map to Technology ids
         technologies = row.get("technologies")
-        tech_ids = list()
         if technologies:
-            for tech in technologies.split(","):
-                tech_obj = Technology.objects.filter(title__iexact=tech.lower()).first()
-                if not tech_obj:
-                    tech_obj = Technology.objects.create(title=tech)
-                tech_ids.append(tech_obj.id)
-            row["technologies"] = tech_ids
-
-        # Process industries field: split by comma and get or create Industry objects
+            titles = self.split_tags(technologies)
+            self.technology_ids.update(
+                self.resolve_tag_ids(
+                    Technology,
+                    [t for t in titles if t.lower() not in self.technology_ids],
+                )
+            )
+            row["technologies"] = [self.technology_ids[t.lower()] for t in titles]
+
+        # Process industries field: split by comma and map to Industry ids
         industries = row.get("industries")
-        industry_ids = list()
         if industries:
-            for industry in industries.split(","):
-                industry_obj = Industry.objects.filter(
-                    title__iexact=industry.lower()
-                ).first()
-                if not industry_obj:
-                    industry_obj = Industry.objects.create(title=industry)
-                industry_ids.append(industry_obj.id)
-            row["industries"] = industry_ids
+            titles = self.split_tags(industries)
+            self.industry_ids.update(
+                self.resolve_tag_ids(
+                    Industry,
+                    [t for t in titles if t.lower() not in self.industry_ids],
+                )
+            )
+            row["industries"] = [self.industry_ids[t.lower()] for t in titles]
 
         # Set user_id in the row if provided in kwargs
         user_id = kwargs.get("user_id")
@@ -164,26 +257,6 @@ class ProjectResource(resources.ModelResource):
             instance.user_id = user_id
 
 
-class ProjectResourceExport(ProjectResource):
-    class Meta:
-        model = Project
-        fields = (
-            "title",
-            "description",
-            "url",
-            "industries",
-            "technologies",
-        )
-
-        export_order = (
-            "title",
-            "description",
-            "url",
-            "industries",
-            "technologies",
-        )
-
-
 class UserSelectForm(ImportForm):
     # Custom form to select a user during import
     user = forms.ModelChoiceField(
@@ -250,42 +323,27 @@ class ProjectAdmin(ImportExportModelAdmin):
             )
 
             if user_form.is_valid():
-                file = request.FILES["import_file"]
-                data = file.read().decode("utf-8")
-
-                dataset = self.get_import_formats()[0]().create_dataset(
-                    data, delimiter=";"
-                )
-                # Process the dataset with the selected user_id
-                result = self.process_dataset(
-                    dataset,
-                    request=request,
-                    form=user_form,
+                # Imported in the background in batches, each one in its own transaction
+                job = create_import_job(
+                    request.FILES["import_file"],
                     user_id=user_form.cleaned_data["user"].id,
-                    *args,
-                    **kwargs,
+                    created_by=request.user,
+                    atomic=False,
                 )
-                log(f"Result: {result.totals}")
-                if not result.has_errors() and not result.has_validation_errors():
-                    created_or_updated_ids = set()
-                    for row_result in result.rows:
-                        if row_result.import_type in ("new", "update"):
-                            created_or_updated_ids.add(row_result.object_id)
-
-                    # Bulk indexing of only newly created or updated projects
-                    projects_to_index = Project.objects.filter(
-                        id__in=created_or_updated_ids
-                    )
-                    actions = (
-                        ProjectDocument.get_indexing_action(project)
-                        for project in projects_to_index
+                messages.success(
+                    request,
+                    format_html(
+                        'Import started, follow its progress <a href="{}">here</a>.',
+                        reverse("import_job", args=[job.id]),
+                    ),
+                )
+                return HttpResponseRedirect(
+                    reverse(
+                        "admin:%s_%s_changelist"
+                        % (self.opts.app_label, self.opts.model_name),
+                        current_app=self.admin_site.name,
                     )
-                    index_result = bulk(ProjectDocument._get_connection(), actions)
-                    log(f"Indexing Result: {index_result}")
-                    messages.success(request, "Import successful!")
-                    return self.process_result(result, request)
-                else:
-                    messages.error(request, "Import failed due to errors.")
+                )
 
         context = self.get_import_context_data(**kwargs)
         context["form"] = user_form
@@ -305,9 +363,10 @@ class ProjectAdmin(ImportExportModelAdmin):
                 queryset = self.get_queryset(request)
                 if user:
                     queryset = queryset.filter(user=user)
-                export_data = self.get_export_data(request, queryset, *args, **kwargs)
-                content_type = self.get_export_formats()[0].CONTENT_TYPE
-                response = HttpResponse(export_data, content_type=content_type)
+                # Rows are written as they are fetched, the file is never held in memory
+                response = StreamingHttpResponse(
+                    iter_projects_csv(queryset), content_type=SemicolonCSV.CONTENT_TYPE
+                )
                 response["Content-Disposition"] = f'attachment; filename="projects.csv"'
                 return response
         else:
@@ -321,31 +380,25 @@ class ProjectAdmin(ImportExportModelAdmin):
 
         return TemplateResponse(request, self.import_template_name, context)
 
-    def get_export_data(self, request, queryset, *args, **kwargs):
-        export_format = self.get_export_formats()[0]()
-
-        export_data = export_format.export_data(
-            ProjectResourceExport().export(queryset=queryset),
-            **kwargs,
-        )
-
-        return export_data
-
     def delete_model(self, request, obj):
         """
         Delete a model instance and its corresponding index in Elasticsearch.
         """
-        ProjectDocument.get(id=obj.id).delete()
+        project_id = obj.id
         obj.delete()
+        enqueue_project_indexing(obj.user_id, [project_id])
 
     def delete_queryset(self, request, queryset):
         """
         Delete multiple model instances and their corresponding indexes in Elasticsearch.
         """
-        count = queryset.count()
-        for obj in queryset:
-            ProjectDocument.get(id=obj.id).delete()
+        ids_by_user = defaultdict(list)
+        for project_id, user_id in queryset.values_list("id", "user_id"):
+            ids_by_user[user_id].append(project_id)
+        count = sum(len(ids) for ids in ids_by_user.values())
         queryset.delete()
+        for user_id, project_ids in ids_by_user.items():
+            enqueue_project_indexing(user_id, project_ids)
         self.message_user(
             request, f"Successfully deleted {count} projects and their indexes."
         )
@@ -0,0 +1,66 @@
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import redis
+
+from config.redis import get_redis
+
+
+class RedisBuffer:
+    """
+    Redis key collecting items until a task applies all of them at once.
+
+    Writers add items to pending_key with the Redis command fitting their data,
+    then call schedule. take hands the items to one run at a time: pending_key is
+    renamed to processing_key, which is kept if the run fails, so the next run
+    applies those items before taking new ones.
+    """
+
+    def __init__(self, name: str, lock_timeout: int = 300, blocking_timeout: int = 60):
+        self.pending_key = f"{name}:pending"
+        self.processing_key = f"{name}:processing"
+        self.scheduled_key = f"{name}:scheduled"
+        self.lock_key = f"{name}:lock"
+        self.lock_timeout = lock_timeout
+        self.blocking_timeout = blocking_timeout
+
+    def schedule(self, task, delay: int):
+        """
+        Run the task in delay seconds, unless a run is scheduled already: the
+        scheduled run picks up everything added until it starts.
+        """
+        if get_redis().set(self.scheduled_key, 1, nx=True, ex=delay * 10):
+            task.apply_async(countdown=delay)
+
+    @contextmanager
+    def take(self) -> Iterator[Optional[str]]:
+        """
+        Lock the buffer and yield the key holding the items to apply, None when
+        there are none. The items are dropped once the block exits without error.
+
+        Raises:
+            redis.exceptions.LockError: Another run holds the buffer.
+        """
+        client = get_redis()
+        # Items added from now on need another run
+        client.delete(self.scheduled_key)
+
+        with client.lock(
+            self.lock_key,
+            timeout=self.lock_timeout,
+            blocking_timeout=self.blocking_timeout,
+        ):
+            if not self._start_processing(client):
+                yield None
+                return
+            yield self.processing_key
+            client.delete(self.processing_key)
+
+    def _start_processing(self, client: redis.Redis) -> bool:
+        if client.exists(self.processing_key):
+            return True
+        # Only the lock holder moves the pending items, they can't vanish in between
+        if not client.exists(self.pending_key):
+            return False
+        client.rename(self.pending_key, self.processing_key)
+        return True
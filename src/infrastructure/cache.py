@@ -0,0 +1,135 @@
+import hashlib
+import json
+from uuid import uuid4
+
+import redis
+from django.core.cache import cache
+
+from config import settings
+from config.logging import log
+from config.redis import get_redis
+
+SEARCH_CACHE_STATS_KEY = "projects:search:stats"
+
+
+def _generation_key(user_id) -> str:
+    return f"projects:generation:{user_id}"
+
+
+def _facets_key(user_id, generation: str) -> str:
+    return f"projects:facets:{user_id}:{generation}"
+
+
+def get_index_generation(user_id) -> str:
+    """
+    Return the current generation of the user's indexed projects.
+
+    Every cache entry derived from the user's projects is keyed by this value,
+    so bumping it invalidates all of them at once.
+    """
+    key = _generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, uuid4().hex, timeout=None)
+        # Another request may have won the race, always use the stored value
+        generation = cache.get(key) or ""
+    return generation
+
+
+def bump_index_generation(user_id):
+    """
+    Invalidate everything cached for the user's projects.
+    Must be called whenever projects of the user are created, updated or deleted.
+    """
+    cache.set(_generation_key(user_id), uuid4().hex, timeout=None)
+
+
+def get_cached_facets(user_id, generation: str):
+    """
+    Return the overall facets of the user or None if they are not cached.
+
+    The facets are a dict with "technologies" and "industries" (value -> count)
+    and "project_count".
+    """
+    return cache.get(_facets_key(user_id, generation))
+
+
+def set_cached_facets(user_id, generation: str, facets: dict):
+    """
+    Store the overall facets computed while the given generation was current.
+    """
+    cache.set(
+        _facets_key(user_id, generation),
+        facets,
+        timeout=settings.FACETS_CACHE_TIMEOUT,
+    )
+
+
+def _shared_page_key(link_uuid, version: str) -> str:
+    return f"project_sets:page:{link_uuid}:{version}"
+
+
+def get_cached_shared_page(link_uuid, version: str):
+    """
+    Return the rendered public page of a shared set or None if it is not cached.
+    The version changes with the content of the set, so edits invalidate the page.
+    """
+    return cache.get(_shared_page_key(link_uuid, version))
+
+
+def set_cached_shared_page(link_uuid, version: str, content: str):
+    cache.set(
+        _shared_page_key(link_uuid, version),
+        content,
+        timeout=settings.SHARED_SET_PAGE_CACHE_TIMEOUT,
+    )
+
+
+def search_cache_key(user_id, generation: str, search_params: dict) -> str:
+    """
+    Return the cache key of a search. Filters are sorted, so the order they were
+    selected in doesn't matter.
+    """
+    normalized = {
+        key: sorted(set(value)) if isinstance(value, (list, tuple)) else value
+        for key, value in search_params.items()
+        if value not in (None, "", [])
+    }
+    digest = hashlib.sha256(
+        json.dumps(normalized, sort_keys=True).encode()
+    ).hexdigest()
+    return f"projects:search:{user_id}:{generation}:{digest}"
+
+
+def get_cached_search(key: str):
+    """
+    Return the cached results of a search or None, counting the hit or miss.
+    """
+    results = cache.get(key)
+    _count_search_cache("hits" if results is not None else "misses")
+    return results
+
+
+def set_cached_search(key: str, results: dict):
+    cache.set(key, results, timeout=settings.SEARCH_RESULTS_CACHE_TIMEOUT)
+
+
+def _count_search_cache(counter: str):
+    try:
+        get_redis().hincrby(SEARCH_CACHE_STATS_KEY, counter, 1)
+    except redis.RedisError as e:
+        log(f"Failed to count search cache {counter}: {e}", "warning")
+
+
+def get_search_cache_stats() -> dict:
+    """
+    Return the number of hits and misses of the search results cache.
+    """
+    stats = get_redis().hgetall(SEARCH_CACHE_STATS_KEY)
+    hits = int(stats.get("hits", 0))
+    misses = int(stats.get("misses", 0))
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / (hits + misses) if hits + misses else 0,
+    }
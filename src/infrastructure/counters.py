@@ -0,0 +1,100 @@
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+from typing import Dict, List, Sequence, Type
+
+import redis
+from django.db import transaction
+from django.db.models import F, Model, Q
+
+from config.logging import log
+from config.redis import get_redis
+
+from .buffers import RedisBuffer
+from .models import FilterUsage
+
+FILTER_USAGE = RedisBuffer("filter_usage", lock_timeout=60, blocking_timeout=10)
+# Rows incremented by a single UPDATE
+INCREMENT_BATCH_SIZE = 500
+
+
+def bulk_increment(
+    model: Type[Model],
+    key_fields: Sequence[str],
+    counts: Dict[tuple, int],
+    field: str,
+):
+    """
+    Add the counts to a counter field of the model, creating the missing rows.
+
+    Missing rows are created in bulk, then the counters are incremented with one
+    UPDATE per batch of rows sharing the same increment.
+
+    Args:
+        model (Type[Model]): Model with a unique constraint on key_fields.
+        key_fields (Sequence[str]): Fields identifying a row.
+        counts (Dict[tuple, int]): Increment per tuple of key_fields values.
+        field (str): Counter field to increment.
+    """
+    by_increment = defaultdict(list)
+    for key, increment in counts.items():
+        by_increment[increment].append(Q(**dict(zip(key_fields, key))))
+
+    with transaction.atomic():
+        model.objects.bulk_create(
+            [model(**dict(zip(key_fields, key))) for key in counts],
+            ignore_conflicts=True,
+        )
+        for increment, conditions in by_increment.items():
+            for i in range(0, len(conditions), INCREMENT_BATCH_SIZE):
+                model.objects.filter(
+                    reduce(or_, conditions[i : i + INCREMENT_BATCH_SIZE])
+                ).update(**{field: F(field) + increment})
+
+
+def record_filter_usage(filter_type: str, filter_values: List[str]):
+    """
+    Count the usage of search filters in Redis, without touching the database.
+    The counts are written to FilterUsage by flush_filter_usage.
+
+    Args:
+        filter_type (str): "technology" or "industry".
+        filter_values (List[str]): Selected values of the filter.
+    """
+    if not filter_values:
+        return
+
+    max_length = FilterUsage._meta.get_field("filter_value").max_length
+    try:
+        pipeline = get_redis().pipeline(transaction=False)
+        for filter_value in filter_values:
+            pipeline.hincrby(
+                FILTER_USAGE.pending_key,
+                f"{filter_type}:{filter_value[:max_length]}",
+                1,
+            )
+        pipeline.execute()
+    except redis.RedisError as e:
+        # Statistics must never break the search
+        log(f"Failed to record filter usage: {e}", "warning")
+
+
+def flush_filter_usage() -> int:
+    """
+    Move the filter usage counts buffered in Redis to FilterUsage.
+
+    Returns:
+        int: The number of filters updated.
+    """
+    with FILTER_USAGE.take() as key:
+        if key is None:
+            return 0
+        counts = {}
+        for field, count in get_redis().hgetall(key).items():
+            filter_type, filter_value = field.split(":", 1)
+            counts[(filter_type, filter_value)] = int(count)
+        bulk_increment(
+            FilterUsage, ("filter_type", "filter_value"), counts, "usage_count"
+        )
+
+    return len(counts)
@@ -1,11 +1,27 @@
+import base64
+import binascii
+import json
+from fnmatch import fnmatch
+
+from django.db.models import Prefetch
 from django_elasticsearch_dsl import Document, fields
 from django_elasticsearch_dsl.registries import registry
+from elasticsearch import BadRequestError, NotFoundError
 from elasticsearch_dsl import Q, analyzer
 from typing import List
 
 from config import settings
+from config.logging import log
 from collections import OrderedDict
 
+from .cache import (
+    get_cached_facets,
+    get_cached_search,
+    get_index_generation,
+    search_cache_key,
+    set_cached_facets,
+    set_cached_search,
+)
 from .models import Industry, Project, Technology
 
 # Define an analyzer to strip HTML tags and apply standard tokenization and filtering
@@ -55,6 +71,7 @@ class ProjectDocument(Document):
         Elasticsearch index settings.
         """
 
+        # An alias to the timestamped index built by infrastructure.indexing.reindex_projects
         name = "projects"
         settings = {"number_of_shards": 1, "number_of_replicas": 0}
 
@@ -75,6 +92,13 @@ class ProjectDocument(Document):
         ]
         related_models = [Industry, Technology]
 
+    @classmethod
+    def _matches(cls, hit):
+        """
+        Hits come from the timestamped indices behind the alias.
+        """
+        return fnmatch(hit.get("_index", ""), f"{cls._index._name}*")
+
     def get_queryset(self):
         """
         Override the default queryset to include related fields.
@@ -106,25 +130,110 @@ class ProjectDocument(Document):
     def get_indexing_action(project):
         """
         Return the data necessary for bulk indexing of the given project.
+        Uses the prefetched industries and technologies of the project if available.
         """
         return {
             "_op_type": "index",
             "_index": ProjectDocument.Index.name,
             "_id": project.id,
             "_source": {
+                "id": project.id,
                 "title": project.title,
                 "description": project.description,
                 "created_at": project.created_at,
                 "updated_at": project.updated_at,
                 "url": project.url,
-                "industries": list(project.industries.values_list("title", flat=True)),
-                "technologies": list(
-                    project.technologies.values_list("title", flat=True)
-                ),
-                "user": {"id": project.user.id},
+                "industries": project.industries_indexing(),
+                "technologies": project.technologies_indexing(),
+                "user": {"id": project.user_id},
             },
         }
 
+    @staticmethod
+    def get_indexing_actions(queryset, chunk_size: int = settings.INDEXING_CHUNK_SIZE):
+        """
+        Yield the bulk indexing actions of all projects in the queryset.
+
+        The projects are fetched in chunks together with the titles of their industries
+        and technologies, so the number of queries doesn't depend on the number of projects
+        in a chunk. Prefetches of the queryset, e.g. of get_queryset, are replaced.
+        """
+        # Django refuses to prefetch a relation twice with different querysets
+        projects = queryset.prefetch_related(None).prefetch_related(
+            Prefetch("industries", queryset=Industry.objects.only("title")),
+            Prefetch("technologies", queryset=Technology.objects.only("title")),
+        )
+        for project in projects.iterator(chunk_size=chunk_size):
+            yield ProjectDocument.get_indexing_action(project)
+
+    @staticmethod
+    def get_deleting_actions(project_ids):
+        """
+        Yield the bulk actions deleting the documents of the given projects.
+        """
+        for project_id in project_ids:
+            yield {
+                "_op_type": "delete",
+                "_index": ProjectDocument.Index.name,
+                "_id": project_id,
+            }
+
+    @staticmethod
+    def is_missing_document_error(error) -> bool:
+        """
+        Return True if the bulk error is about deleting a document which doesn't exist,
+        e.g. of a project which was never indexed.
+        """
+        return error.get("delete", {}).get("status") == 404
+
+
+def encode_page_token(pit_id: str, search_after: list, page: int) -> str:
+    """
+    Encode the position of a cursor into an opaque, URL safe page token.
+    """
+    data = json.dumps({"pit": pit_id, "after": search_after, "page": page})
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_page_token(page_token: str):
+    """
+    Decode a page token created by encode_page_token.
+
+    Returns:
+        dict: The "pit", "after" and "page" of the cursor or None if the token is invalid.
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(page_token.encode()))
+    except (binascii.Error, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    # The point in time is None when the first page was fetched without one
+    if data.get("pit") is not None and not isinstance(data["pit"], str):
+        return None
+    # The sort values of the last hit: the score or the sort field, then the id
+    after = data.get("after")
+    if not isinstance(after, list) or len(after) != 2:
+        return None
+    if not isinstance(after[0], (int, float, str, type(None))) or not isinstance(
+        after[1], int
+    ):
+        return None
+    if not isinstance(data.get("page"), int) or data["page"] < 1:
+        return None
+    return data
+
+
+def open_point_in_time() -> str:
+    """
+    Open a point in time on the projects index, used to page consistently with search_after.
+    """
+    response = ProjectDocument._get_connection().open_point_in_time(
+        index=ProjectDocument._index._name,
+        keep_alive=settings.SEARCH_POINT_IN_TIME_KEEP_ALIVE,
+    )
+    return response["id"]
+
 
 def search_projects(
     user,
@@ -134,10 +243,15 @@ def search_projects(
     page: int = settings.DEFAULT_FIRST_PAGE,
     size: int = settings.DEFAULT_SIZE_PAGE,
     sort_by: str = None,
+    page_token: str = None,
 ):
     """
     Search for projects in Elasticsearch.
 
+    Shallow pages are fetched by page number. Every response also carries a page token
+    for the next page, which continues with search_after in a point in time, so deep
+    pages cost the same as the first one.
+
     Args:
         user (_type_): The user performing the search.
         search_string (str, optional): The search query string. Defaults to None.
@@ -146,25 +260,103 @@ def search_projects(
         page (int, optional): The page number for pagination. Defaults to settings.DEFAULT_FIRST_PAGE.
         size (int, optional): The number of results per page. Defaults to settings.DEFAULT_SIZE_PAGE.
         sort_by (str, optional): The field to sort by. Defaults to None.
+        page_token (str, optional): Token of the page to fetch, takes precedence over page. Defaults to None.
 
     Returns:
-        dict: A dictionary containing search results and facet counts.
+        dict: A dictionary containing the found documents and their total, facet counts,
+            the current page and the token of the next page (None on the last page).
+    """
+    search_params = {
+        "search_string": search_string,
+        "technology_filters": technology_filters,
+        "industry_filters": industry_filters,
+        "page": page,
+        "size": size,
+        "sort_by": sort_by,
+        "page_token": page_token,
+    }
+    # Cached results are scoped to the generation, so project writes invalidate them
+    generation = get_index_generation(user.id)
+    cache_key = search_cache_key(user.id, generation, search_params)
+
+    results = get_cached_search(cache_key)
+    if results is not None:
+        # Only the ids of the hits are cached, the documents are fetched in one request
+        ids = results.pop("ids")
+        results["data"] = ProjectDocument.mget(ids, missing="skip") if ids else []
+        return results
+
+    try:
+        results = _execute_search(user, generation, **search_params)
+    except BadRequestError as e:
+        if not page_token:
+            raise
+        # Well formed but unusable sort values, e.g. of another sort
+        log(f"Invalid page token, falling back to the page number: {e}", "warning")
+        results = _execute_search(
+            user, generation, **{**search_params, "page_token": None}
+        )
+    set_cached_search(
+        cache_key,
+        {
+            **{key: value for key, value in results.items() if key != "data"},
+            "ids": [hit.meta.id for hit in results["data"]],
+        },
+    )
+    return results
+
+
+def _execute_search(
+    user,
+    generation: str,
+    search_string: str = None,
+    technology_filters: List[str] = None,
+    industry_filters: List[str] = None,
+    page: int = settings.DEFAULT_FIRST_PAGE,
+    size: int = settings.DEFAULT_SIZE_PAGE,
+    sort_by: str = None,
+    page_token: str = None,
+):
+    """
+    Run the project search in Elasticsearch, see search_projects.
     """
     search = ProjectDocument.search()
 
     search = search.filter("term", user__id=user.id)
-    search.aggs.bucket("technologies", "terms", field="technologies.raw", size=10000)
-    industries_agg = search.aggs.bucket(
-        "industries", "terms", field="industries.raw", size=10000
-    )
-    # Add a sub-aggregation to calculate potential projects if each industry filter is applied
-    industries_agg.bucket(
-        "potential_projects",
-        "filter",
-        filter=(
-            ~Q("terms", industries__raw=industry_filters) if industry_filters else Q()
-        ),
-    )
+
+    # The overall facets only change when the user's projects change, so they are
+    # served from the cache when possible. Otherwise they are computed in a global
+    # bucket narrowed down to the user's projects, in the same round trip as the hits.
+    overall_facets = get_cached_facets(user.id, generation)
+    if overall_facets is None:
+        overall_agg = search.aggs.bucket("overall", "global").bucket(
+            "user_projects", "filter", filter=Q("term", user__id=user.id)
+        )
+        overall_agg.bucket(
+            "technologies", "terms", field="technologies.raw", size=10000
+        )
+        overall_agg.bucket("industries", "terms", field="industries.raw", size=10000)
+
+    # Without a query and filters the facet counts equal the overall ones
+    is_filtered = bool(search_string or technology_filters or industry_filters)
+    with_facet_aggs = is_filtered or overall_facets is None
+    if with_facet_aggs:
+        search.aggs.bucket(
+            "technologies", "terms", field="technologies.raw", size=10000
+        )
+        industries_agg = search.aggs.bucket(
+            "industries", "terms", field="industries.raw", size=10000
+        )
+        # Add a sub-aggregation to calculate potential projects if each industry filter is applied
+        industries_agg.bucket(
+            "potential_projects",
+            "filter",
+            filter=(
+                ~Q("terms", industries__raw=industry_filters)
+                if industry_filters
+                else Q()
+            ),
+        )
 
     if search_string:
         search = search.query(
@@ -195,105 +387,125 @@ def search_projects(
 
     if industry_filters:
         search = search.filter("terms", industries__raw=industry_filters)
-        industries_agg.bucket(
-            "potential_projects",
-            "filter",
-            filter=~Q("terms", industries__raw=industry_filters),
-        )
-    # Apply pagination
-    search = search[(page - 1) * size : page * size]
-
-    if sort_by:
-        search = search.sort({sort_by: {"order": "asc"}})
-
-    # Aggregate technology and industry counts
-    response = search.execute()
-
-    technology_counts = OrderedDict(
-        (bucket.key, bucket.doc_count)
-        for bucket in response.aggregations.technologies.buckets
+    # The id is used as a tiebreaker, so every hit has a unique position for search_after
+    search = search.sort(
+        {sort_by: {"order": "asc"}} if sort_by else "_score", {"id": {"order": "asc"}}
     )
-    # Create industry counts with additional info on potential projects if filter is applied
 
-    # Fetch all unique industries for the user to ensure they are always shown
-    all_industries_search = ProjectDocument.search()
-    all_industries_search = all_industries_search.filter("term", user__id=user.id)
-    all_industries_search.aggs.bucket(
-        "all_industries", "terms", field="industries.raw", size=10000
-    )
-    all_industries_response = all_industries_search.execute()
+    # Apply pagination
+    cursor = decode_page_token(page_token) if page_token else None
+    if cursor:
+        page = cursor["page"]
+        # A point in time can't be combined with an index, it already refers to one
+        search = search.index().extra(
+            size=size,
+            search_after=cursor["after"],
+            pit={
+                "id": cursor["pit"] or open_point_in_time(),
+                "keep_alive": settings.SEARCH_POINT_IN_TIME_KEEP_ALIVE,
+            },
+        )
+    else:
+        search = search[(page - 1) * size : page * size]
+
+    # Hits, filtered facets and overall facets in a single request
+    try:
+        response = search.execute()
+    except NotFoundError:
+        if not cursor:
+            raise
+        # The point in time expired, continue from the same position in a new one
+        search = search.extra(
+            pit={
+                "id": open_point_in_time(),
+                "keep_alive": settings.SEARCH_POINT_IN_TIME_KEEP_ALIVE,
+            }
+        )
+        response = search.execute()
+
+    next_page_token = None
+    total = response.hits.total
+    if len(response.hits) == size and (
+        total.relation != "eq" or page * size < total.value
+    ):
+        next_page_token = encode_page_token(
+            response.to_dict().get("pit_id"),
+            list(response.hits[-1].meta.sort),
+            page + 1,
+        )
 
-    all_industries = {
-        bucket.key: bucket.doc_count
-        for bucket in all_industries_response.aggregations.all_industries.buckets
-    }
+    if overall_facets is None:
+        user_projects = response.aggregations.overall.user_projects
+        overall_facets = {
+            "technologies": {
+                bucket.key: bucket.doc_count
+                for bucket in user_projects.technologies.buckets
+            },
+            "industries": {
+                bucket.key: bucket.doc_count
+                for bucket in user_projects.industries.buckets
+            },
+            "project_count": user_projects.doc_count,
+        }
+        set_cached_facets(user.id, generation, overall_facets)
 
-    all_technologies_search = ProjectDocument.search()
-    all_technologies_search = all_technologies_search.filter("term", user__id=user.id)
-    all_technologies_search.aggs.bucket(
-        "all_technologies", "terms", field="technologies.raw", size=10000
-    )
-    all_technologies_response = all_technologies_search.execute()
+    if with_facet_aggs:
+        technology_counts = {
+            bucket.key: bucket.doc_count
+            for bucket in response.aggregations.technologies.buckets
+        }
+        industry_counts = {
+            bucket.key: bucket.doc_count
+            for bucket in response.aggregations.industries.buckets
+        }
+    else:
+        technology_counts = overall_facets["technologies"]
+        industry_counts = overall_facets["industries"]
 
-    all_technologies = {
-        bucket.key: bucket.doc_count
-        for bucket in all_technologies_response.aggregations.all_technologies.buckets
+    return {
+        "data": list(response.hits),
+        "total": total.value,
+        "page": page,
+        "next_page_token": next_page_token,
+        "overall_project_count": overall_facets["project_count"],
+        "facets": {
+            "technologies": _merge_facet_counts(
+                technology_counts, overall_facets["technologies"]
+            ),
+            "industries": _merge_facet_counts(
+                industry_counts, overall_facets["industries"]
+            ),
+        },
     }
 
-    industry_counts = OrderedDict()
-    for bucket in response.aggregations.industries.buckets:
-        industry_counts[bucket.key] = {
-            "count": bucket.doc_count,
-            "overall_count": all_industries[bucket.key],
-        }
 
-    # Ensure all industries are included in the final result
-    for industry in all_industries.keys():
-        if industry not in industry_counts:
-            industry_counts[industry] = {
-                "count": 0,
-                "overall_count": all_industries[industry],
-            }
+def _merge_facet_counts(counts: dict, overall_counts: dict) -> OrderedDict:
+    """
+    Combine the facet counts of the search with the overall counts of the user.
+
+    Args:
+        counts (dict): Document count per facet value matching the search.
+        overall_counts (dict): Overall document count per facet value.
 
-    technology_counts = OrderedDict()
-    for bucket in response.aggregations.technologies.buckets:
-        technology_counts[bucket.key] = {
-            "count": bucket.doc_count,
-            "overall_count": all_technologies[bucket.key],
+    Returns:
+        OrderedDict: Facet value -> {"count", "overall_count"}, sorted by overall count.
+    """
+    merged = OrderedDict()
+    for key, count in counts.items():
+        merged[key] = {
+            "count": count,
+            "overall_count": overall_counts.get(key, count),
         }
 
-    # Ensure all industries are included in the final result
-    for technology in all_technologies.keys():
-        if technology not in technology_counts:
-            technology_counts[technology] = {
-                "count": 0,
-                "overall_count": all_technologies[technology],
-            }
+    # Ensure all values of the user are included in the final result
+    for key, overall_count in overall_counts.items():
+        if key not in merged:
+            merged[key] = {"count": 0, "overall_count": overall_count}
 
-    # Sort the dictionaries by keys (alphabetical order)
-    technology_counts = OrderedDict(
+    return OrderedDict(
         sorted(
-            technology_counts.items(),
+            merged.items(),
             key=lambda x: (x[1]["overall_count"], x[0]),
             reverse=True,
         )
     )
-    industry_counts = OrderedDict(
-        sorted(
-            industry_counts.items(),
-            key=lambda x: (x[1]["overall_count"], x[0]),
-            reverse=True,
-        )
-    )
-    # get only the count of projects for the user
-    overall_projects_search = ProjectDocument.search().filter("term", user__id=user.id)
-
-    overall_project_count = overall_projects_search.execute().hits.total.value
-    return {
-        "data": response,
-        "overall_project_count": overall_project_count,
-        "facets": {
-            "technologies": technology_counts,
-            "industries": industry_counts,
-        },
-    }
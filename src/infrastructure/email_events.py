@@ -0,0 +1,56 @@
+import json
+
+from config import settings
+from config.logging import log
+from config.redis import get_redis
+
+from .buffers import RedisBuffer
+from .mailgun import apply_email_statuses
+from .models import EmailStatus
+
+EMAIL_EVENTS = RedisBuffer("email_events")
+
+# Statuses of the normalized event types of the tracking webhook
+TRACKING_EVENT_STATUSES = {
+    "delivered": EmailStatus.Status.DELIVERED,
+    "opened": EmailStatus.Status.OPENED,
+    "bounced": EmailStatus.Status.FAILED,
+    "rejected": EmailStatus.Status.FAILED,
+    "failed": EmailStatus.Status.FAILED,
+}
+
+
+def enqueue_email_status(message_id: str, status: str):
+    """
+    Queue a status update received from the tracking webhook.
+
+    The updates are collected in Redis and a task applies all of them after
+    EMAIL_EVENTS_DELAY seconds, so bursts of events end up in a single bulk update.
+    """
+    from .tasks import process_email_events
+
+    get_redis().rpush(
+        EMAIL_EVENTS.pending_key,
+        json.dumps({"message_id": message_id, "status": status}),
+    )
+    EMAIL_EVENTS.schedule(process_email_events, settings.EMAIL_EVENTS_DELAY)
+
+
+def process_email_events() -> int:
+    """
+    Apply the queued status updates to EmailStatus with a single bulk update.
+
+    Returns:
+        int: The number of applied updates.
+    """
+    with EMAIL_EVENTS.take() as key:
+        if key is None:
+            return 0
+        updates = [json.loads(update) for update in get_redis().lrange(key, 0, -1)]
+
+        updated = apply_email_statuses(
+            (update["message_id"], update["status"]) for update in updates
+        )
+        log(f"Applied {len(updates)} email events, {updated} statuses updated")
+
+    return len(updates)
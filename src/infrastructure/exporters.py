@@ -0,0 +1,55 @@
+import csv
+from typing import Iterator
+
+from django.db.models import Prefetch
+
+from config import settings
+
+from .models import Industry, Technology
+
+EXPORT_COLUMNS = ("title", "description", "url", "industries", "technologies")
+
+
+class Echo:
+    """
+    File-like object which returns what is written to it, so the csv writer
+    produces lines instead of buffering them.
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_projects_csv(
+    queryset, chunk_size: int = settings.EXPORT_CHUNK_SIZE, delimiter: str = ";"
+) -> Iterator[str]:
+    """
+    Yield the projects of the queryset as CSV lines, in the format the import reads.
+
+    The projects are fetched in chunks together with the titles of their industries
+    and technologies, so neither the memory used nor the number of queries depends
+    on the number of projects.
+    """
+    writer = csv.writer(Echo(), delimiter=delimiter)
+    yield writer.writerow(EXPORT_COLUMNS)
+
+    projects = (
+        queryset.only("id", "title", "description", "url")
+        .order_by("id")
+        .prefetch_related(
+            Prefetch("industries", queryset=Industry.objects.only("title")),
+            Prefetch("technologies", queryset=Technology.objects.only("title")),
+        )
+    )
+    for project in projects.iterator(chunk_size=chunk_size):
+        yield writer.writerow(
+            (
+                project.title,
+                project.description,
+                project.url or "",
+                ",".join(industry.title for industry in project.industries.all()),
+                ",".join(
+                    technology.title for technology in project.technologies.all()
+                ),
+            )
+        )
@@ -0,0 +1,133 @@
+import csv
+from typing import Callable, Iterable, Iterator, List
+
+import tablib
+from django.db import transaction
+
+from config import settings
+
+MAX_REPORTED_ERRORS = 100
+
+
+def iter_csv_batches(
+    stream: Iterable[str], batch_size: int, delimiter: str = ";"
+) -> Iterator[tablib.Dataset]:
+    """
+    Parse a CSV text stream and yield its rows in datasets of at most batch_size rows.
+    Only one batch is kept in memory at a time.
+    """
+    reader = csv.reader(stream, delimiter=delimiter)
+    headers = [header.strip() for header in next(reader, [])]
+    if not headers:
+        return
+
+    rows = []
+    for row in reader:
+        if not any(value.strip() for value in row):
+            continue
+        # Pad or cut rows to the header length, tablib requires equal dimensions
+        rows.append((row + [""] * len(headers))[: len(headers)])
+        if len(rows) >= batch_size:
+            yield tablib.Dataset(*rows, headers=headers)
+            rows = []
+    if rows:
+        yield tablib.Dataset(*rows, headers=headers)
+
+
+class ProjectCSVImporter:
+    """
+    Import projects from a semicolon delimited CSV stream in fixed-size batches.
+
+    Every batch is validated and written by ProjectResource in its own transaction,
+    which is rolled back if the batch has errors. Only one batch is kept in memory,
+    so the memory used doesn't depend on the size of the file.
+
+    In atomic mode the whole import runs in one transaction and every batch in a
+    savepoint. If any batch fails, everything is rolled back, which gives the same
+    guarantee as a dry run followed by the import, in a single pass.
+    """
+
+    def __init__(
+        self,
+        user_id,
+        batch_size: int = settings.IMPORT_BATCH_SIZE,
+        dry_run: bool = False,
+        atomic: bool = False,
+        progress: Callable[["ProjectCSVImporter"], None] = None,
+    ):
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.atomic = atomic
+        self.progress = progress
+
+        # Imported here, the admin module uses the importer
+        from .admin import ProjectResource
+
+        self.resource = ProjectResource()
+
+        self.rows_processed = 0
+        self.totals = {"new": 0, "update": 0, "skip": 0, "error": 0, "invalid": 0}
+        self.errors: List[dict] = []
+        self.project_ids = set()
+
+    @property
+    def has_errors(self) -> bool:
+        return bool(self.totals["error"] or self.totals["invalid"])
+
+    def run(self, stream: Iterable[str]) -> "ProjectCSVImporter":
+        if not self.atomic:
+            self.import_batches(stream)
+            return self
+
+        with transaction.atomic():
+            # Batches after a failed one are still validated, to report all errors
+            self.import_batches(stream)
+            if self.has_errors:
+                transaction.set_rollback(True)
+                self.project_ids.clear()
+        return self
+
+    def import_batches(self, stream: Iterable[str]):
+        for dataset in iter_csv_batches(stream, self.batch_size):
+            self.import_batch(dataset)
+            if self.progress:
+                self.progress(self)
+
+    def import_batch(self, dataset: tablib.Dataset):
+        with transaction.atomic():
+            result = self.resource.import_data(
+                dataset,
+                dry_run=self.dry_run,
+                use_transactions=False,
+                user_id=self.user_id,
+            )
+            failed = result.has_errors() or result.has_validation_errors()
+            # A batch with errors is rolled back as a whole, tags created by a dry run too
+            if self.dry_run or failed:
+                transaction.set_rollback(True)
+
+        for import_type in self.totals:
+            self.totals[import_type] += result.totals.get(import_type, 0)
+
+        for row_number, row_errors in result.row_errors():
+            for error in row_errors:
+                self.add_error(self.rows_processed + row_number, str(error.error))
+        for invalid_row in result.invalid_rows:
+            self.add_error(
+                self.rows_processed + invalid_row.number,
+                str(invalid_row.error_dict),
+            )
+
+        if not self.dry_run and not failed:
+            self.project_ids.update(
+                row_result.object_id
+                for row_result in result.rows
+                if row_result.import_type in ("new", "update")
+            )
+
+        self.rows_processed += len(dataset)
+
+    def add_error(self, row_number: int, message: str):
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "message": message})
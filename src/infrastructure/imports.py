@@ -0,0 +1,230 @@
+import os
+from datetime import timedelta
+from uuid import uuid4
+
+import redis
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from elasticsearch.helpers import streaming_bulk
+
+from config import settings
+from config.logging import log
+from config.redis import get_redis
+
+from .cache import bump_index_generation
+from .elastic import ProjectDocument
+from .importers import ProjectCSVImporter
+from .models import ImportJob
+from .outbox import enqueue_project_indexing
+
+IMPORT_PROGRESS_TIMEOUT = 60 * 60 * 24
+
+
+def _progress_key(job_id) -> str:
+    return f"imports:progress:{job_id}"
+
+
+def store_import_file(uploaded_file) -> str:
+    """
+    Copy an uploaded file to IMPORT_FILES_DIR chunk by chunk and return its path.
+    """
+    os.makedirs(settings.IMPORT_FILES_DIR, exist_ok=True)
+    path = os.path.join(settings.IMPORT_FILES_DIR, f"{uuid4().hex}.csv")
+    with open(path, "wb") as destination:
+        for chunk in uploaded_file.chunks():
+            destination.write(chunk)
+    return path
+
+
+def create_import_job(uploaded_file, user_id, created_by, atomic: bool = True):
+    """
+    Store the uploaded CSV and queue its import, once the current transaction commits.
+
+    Args:
+        uploaded_file (UploadedFile): The semicolon delimited CSV file.
+        user_id: Owner of the imported projects.
+        created_by (User): The user who uploaded the file.
+        atomic (bool, optional): Roll back the whole import if any row fails.
+
+    Returns:
+        ImportJob: The pending job.
+    """
+    job = ImportJob.objects.create(
+        user_id=user_id,
+        created_by=created_by,
+        file_path=store_import_file(uploaded_file),
+        atomic=atomic,
+    )
+
+    from .tasks import run_import_job
+
+    transaction.on_commit(lambda: run_import_job.delay(job.id))
+    return job
+
+
+def _save_progress(job_id, values: dict):
+    # Kept out of the database, an atomic import hides its writes until it's done
+    try:
+        client = get_redis()
+        client.hset(_progress_key(job_id), mapping=values)
+        client.expire(_progress_key(job_id), IMPORT_PROGRESS_TIMEOUT)
+    except redis.RedisError as e:
+        log(f"Failed to save progress of import {job_id}: {e}", "warning")
+
+
+def _get_progress(job_id) -> dict:
+    try:
+        progress = get_redis().hgetall(_progress_key(job_id))
+    except redis.RedisError as e:
+        log(f"Failed to get progress of import {job_id}: {e}", "warning")
+        return {}
+    return {key: int(value) for key, value in progress.items()}
+
+
+def _importer_progress(importer: ProjectCSVImporter) -> dict:
+    return {
+        "rows_processed": importer.rows_processed,
+        "created_count": importer.totals["new"],
+        "updated_count": importer.totals["update"],
+        "error_count": importer.totals["error"] + importer.totals["invalid"],
+    }
+
+
+def index_imported_projects(job: ImportJob, project_ids) -> int:
+    """
+    Index the imported projects, reporting the indexed count after every chunk.
+    """
+    projects = ProjectDocument().get_queryset().filter(id__in=project_ids)
+    indexed = 0
+    for ok, error in streaming_bulk(
+        ProjectDocument._get_connection(),
+        ProjectDocument.get_indexing_actions(projects),
+        chunk_size=settings.INDEXING_CHUNK_SIZE,
+        raise_on_error=False,
+        refresh="wait_for",
+    ):
+        if ok:
+            indexed += 1
+            if indexed % settings.INDEXING_CHUNK_SIZE == 0:
+                _save_progress(job.id, {"indexed_count": indexed})
+        else:
+            log(f"Import {job.id} indexing error: {error}", "error")
+    bump_index_generation(job.user_id)
+    return indexed
+
+
+def run_import_job(job_id) -> ImportJob:
+    """
+    Import the stored CSV of the job and index the imported projects.
+    The stored file is deleted afterwards, whatever the result. Projects which
+    fail to be indexed are left to the indexing outbox, they are imported already.
+    """
+    started_at = timezone.now()
+    claimed = ImportJob.objects.filter(
+        id=job_id, status=ImportJob.Status.PENDING
+    ).update(status=ImportJob.Status.RUNNING, started_at=started_at)
+    job = ImportJob.objects.get(id=job_id)
+    if not claimed:
+        # Already run, or failed as stale
+        return job
+
+    importer = ProjectCSVImporter(
+        user_id=job.user_id,
+        atomic=job.atomic,
+        progress=lambda importer: _save_progress(job.id, _importer_progress(importer)),
+    )
+    try:
+        with open(job.file_path, encoding="utf-8", newline="") as stream:
+            importer.run(stream)
+        log(f"Import {job.id} result: {importer.totals}")
+    except Exception as e:
+        log(f"Import {job.id} failed: {e}", "error")
+        importer.add_error(importer.rows_processed, str(e))
+        if job.atomic:
+            # Nothing of the import was committed
+            importer.project_ids.clear()
+        job.status = ImportJob.Status.FAILED
+    else:
+        job.status = (
+            ImportJob.Status.FAILED if importer.has_errors else ImportJob.Status.SUCCEEDED
+        )
+    finally:
+        if os.path.exists(job.file_path):
+            os.remove(job.file_path)
+
+    if importer.project_ids:
+        try:
+            job.indexed_count = index_imported_projects(job, importer.project_ids)
+        except Exception as e:
+            # The imported projects are committed, the outbox indexes them later
+            log(f"Import {job.id} indexing failed: {e}", "error")
+            enqueue_project_indexing(job.user_id, importer.project_ids)
+
+    for field, value in _importer_progress(importer).items():
+        setattr(job, field, value)
+    job.errors = importer.errors
+    job.finished_at = timezone.now()
+    job.save()
+    try:
+        get_redis().delete(_progress_key(job.id))
+    except redis.RedisError:
+        pass
+    return job
+
+
+def fail_stale_import_jobs() -> int:
+    """
+    Fail the jobs left running by a dead worker, or never picked up, for longer
+    than IMPORT_JOB_TIMEOUT, and delete their stored file. Returns their count.
+    """
+    now = timezone.now()
+    deadline = now - timedelta(seconds=settings.IMPORT_JOB_TIMEOUT)
+    stale_jobs = ImportJob.objects.filter(
+        Q(status=ImportJob.Status.RUNNING, started_at__lt=deadline)
+        | Q(status=ImportJob.Status.PENDING, created_at__lt=deadline)
+    )
+    failed = 0
+    for job in stale_jobs:
+        # Skips the job if its worker finished it in the meantime
+        if not ImportJob.objects.filter(id=job.id, status=job.status).update(
+            status=ImportJob.Status.FAILED,
+            errors=job.errors
+            + [{"row": job.rows_processed, "message": "The import was interrupted"}],
+            error_count=job.error_count + 1,
+            finished_at=now,
+        ):
+            continue
+        failed += 1
+        log(f"Import {job.id} failed: no progress since {deadline}", "error")
+        if os.path.exists(job.file_path):
+            os.remove(job.file_path)
+        try:
+            get_redis().delete(_progress_key(job.id))
+        except redis.RedisError:
+            pass
+    return failed
+
+
+def get_import_job_progress(job: ImportJob) -> dict:
+    """
+    Return the progress of the job, live counts while it's running.
+    """
+    progress = {
+        "rows_processed": job.rows_processed,
+        "created_count": job.created_count,
+        "updated_count": job.updated_count,
+        "error_count": job.error_count,
+        "indexed_count": job.indexed_count,
+    }
+    if job.status == ImportJob.Status.RUNNING:
+        progress.update(_get_progress(job.id))
+    return {
+        "id": job.id,
+        "status": job.status,
+        "finished": job.is_finished,
+        **progress,
+        "errors": job.errors,
+        "created_at": job.created_at.isoformat(),
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
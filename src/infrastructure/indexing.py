@@ -0,0 +1,322 @@
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+from typing import Callable, Iterable, Iterator, List
+
+from elasticsearch.helpers import bulk, parallel_bulk, scan
+
+from config import settings
+from config.logging import log
+
+# Models and documents are imported in the functions, this module is imported by the
+# spawned worker processes before Django is set up.
+
+
+def get_alias_indices(client, alias: str) -> List[str]:
+    """
+    Return the concrete indices the alias points to.
+    """
+    if not client.indices.exists_alias(name=alias):
+        return []
+    return list(client.indices.get_alias(name=alias).keys())
+
+
+def iter_id_chunks(queryset, chunk_size: int) -> Iterator[List[int]]:
+    """
+    Yield the ids of the queryset in chunks, using keyset pagination on the id,
+    so every chunk costs the same regardless of its position in the table.
+    """
+    last_id = 0
+    while True:
+        ids = list(
+            queryset.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", flat=True)[:chunk_size]
+        )
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def _init_worker():
+    import django
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+    django.setup()
+
+
+def build_indexing_actions(ids: List[int], index_name: str) -> List[dict]:
+    """
+    Build the bulk indexing actions of the projects with the given ids.
+    Runs in the worker processes of stream_index_projects.
+    """
+    from .elastic import ProjectDocument
+    from .models import Project
+
+    actions = list(
+        ProjectDocument.get_indexing_actions(
+            Project.objects.filter(id__in=ids), chunk_size=len(ids)
+        )
+    )
+    for action in actions:
+        action["_index"] = index_name
+    return actions
+
+
+def _iter_actions(executor, id_chunks, index_name: str, max_pending: int):
+    # Keep a bounded number of chunks in flight, so memory doesn't grow with the table
+    pending = deque()
+    for ids in id_chunks:
+        pending.append(executor.submit(build_indexing_actions, ids, index_name))
+        if len(pending) >= max_pending:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+
+def stream_index_projects(
+    index_name: str,
+    queryset=None,
+    chunk_size: int = settings.INDEXING_CHUNK_SIZE,
+    thread_count: int = 4,
+    processes: int = 2,
+    disable_refresh: bool = True,
+    progress: Callable[[int, int, float], None] = None,
+) -> dict:
+    """
+    Index the projects into the given index as fast as possible.
+
+    The ids are streamed in keyset paginated chunks, the documents are built in a
+    process pool and sent with parallel_bulk. The refresh of the index is disabled
+    during the load and restored afterwards.
+
+    Args:
+        index_name (str): The index to load the documents into.
+        queryset (QuerySet, optional): Projects to index. Defaults to ProjectDocument's queryset.
+        chunk_size (int, optional): Documents per database chunk and bulk request.
+        thread_count (int, optional): Threads sending bulk requests.
+        processes (int, optional): Processes building the documents.
+        disable_refresh (bool, optional): Disable the index refresh during the load.
+        progress (Callable, optional): Called with (indexed, errors, docs/sec) after every chunk.
+
+    Returns:
+        dict: The number of indexed documents, errors and the duration in seconds.
+    """
+    from .elastic import ProjectDocument
+
+    if queryset is None:
+        queryset = ProjectDocument().get_queryset()
+    client = ProjectDocument._get_connection()
+
+    refresh_interval = None
+    if disable_refresh:
+        index_settings = client.indices.get_settings(
+            index=index_name, name="index.refresh_interval"
+        )
+        refresh_interval = (
+            next(iter(index_settings.values()), {})
+            .get("settings", {})
+            .get("index", {})
+            .get("refresh_interval")
+        )
+        client.indices.put_settings(
+            index=index_name, settings={"index": {"refresh_interval": "-1"}}
+        )
+
+    indexed = errors = 0
+    started_at = time.monotonic()
+    try:
+        # Workers are spawned, forked ones would share the database connection
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        ) as executor:
+            actions = _iter_actions(
+                executor,
+                iter_id_chunks(queryset, chunk_size),
+                index_name,
+                max_pending=processes * 2,
+            )
+            for ok, _ in parallel_bulk(
+                client,
+                actions,
+                thread_count=thread_count,
+                chunk_size=chunk_size,
+                raise_on_error=False,
+            ):
+                if ok:
+                    indexed += 1
+                else:
+                    errors += 1
+                if progress and (indexed + errors) % chunk_size == 0:
+                    elapsed = time.monotonic() - started_at
+                    progress(indexed, errors, (indexed + errors) / elapsed)
+    finally:
+        if disable_refresh:
+            # None resets the refresh interval to the default
+            client.indices.put_settings(
+                index=index_name,
+                settings={"index": {"refresh_interval": refresh_interval}},
+            )
+        client.indices.refresh(index=index_name)
+
+    duration = time.monotonic() - started_at
+    if progress:
+        progress(indexed, errors, (indexed + errors) / duration if duration else 0)
+    return {"indexed": indexed, "errors": errors, "duration": duration}
+
+
+def reindex_projects(
+    chunk_size: int = settings.INDEXING_CHUNK_SIZE,
+    thread_count: int = 4,
+    processes: int = 2,
+    keep_indices: int = 1,
+    progress: Callable[[int, int, float], None] = None,
+) -> dict:
+    """
+    Rebuild the projects index without downtime.
+
+    The documents are loaded into a new timestamped index with replicas and refresh
+    disabled. Then its settings are restored and the alias used by the search and the
+    write paths is atomically swapped to it. Old indices are deleted afterwards, except
+    for the keep_indices most recent ones, which allow a rollback.
+
+    Returns:
+        dict: The new index name, the number of indexed documents, errors, the
+            duration in seconds and the number of documents of projects deleted
+            during the load.
+    """
+    from django.utils import timezone
+
+    from .elastic import ProjectDocument
+
+    client = ProjectDocument._get_connection()
+    alias = ProjectDocument._index._name
+    new_index = f"{alias}-{timezone.now():%Y%m%d%H%M%S}"
+    started_at = timezone.now()
+
+    index = ProjectDocument._index.clone(name=new_index)
+    index.settings(number_of_replicas=0, refresh_interval="-1")
+    index.create()
+
+    result = stream_index_projects(
+        new_index,
+        chunk_size=chunk_size,
+        thread_count=thread_count,
+        processes=processes,
+        disable_refresh=False,
+        progress=progress,
+    )
+
+    client.indices.put_settings(
+        index=new_index,
+        settings={
+            "index": {
+                "number_of_replicas": ProjectDocument.Index.settings.get(
+                    "number_of_replicas", 1
+                ),
+                "refresh_interval": None,
+            }
+        },
+    )
+    client.indices.refresh(index=new_index)
+
+    old_indices = get_alias_indices(client, alias)
+    actions = [{"add": {"index": new_index, "alias": alias}}]
+    actions += [{"remove": {"index": name, "alias": alias}} for name in old_indices]
+    if not old_indices and client.indices.exists(index=alias):
+        # The alias replaces an index with the same name, created before aliases were used
+        actions.append({"remove_index": {"index": alias}})
+    client.indices.update_aliases(actions=actions)
+
+    # Projects written to the old index during the load are applied to the new one
+    deleted = catch_up_index(client, new_index, started_at, chunk_size=chunk_size)
+
+    delete_old_indices(client, alias, keep=keep_indices)
+    return {"index": new_index, **result, "deleted": deleted}
+
+
+def _chunked(values: Iterable, chunk_size: int) -> Iterator[list]:
+    values = iter(values)
+    while chunk := list(islice(values, chunk_size)):
+        yield chunk
+
+
+def catch_up_index(
+    client, index_name: str, since, chunk_size: int = settings.INDEXING_CHUNK_SIZE
+) -> int:
+    """
+    Apply the project writes made since the given time to the index: projects updated
+    since then are indexed again and the documents of deleted projects are removed.
+
+    Deleted projects leave no trace in the database, so the ids of all documents in
+    the index are checked against it, chunk by chunk.
+
+    Returns:
+        int: The number of removed documents.
+    """
+    from .elastic import ProjectDocument
+
+    queryset = ProjectDocument().get_queryset()
+
+    deleted_ids = []
+    document_ids = (
+        int(hit["_id"])
+        for hit in scan(
+            client, query={"_source": False}, index=index_name, size=chunk_size
+        )
+    )
+    for ids in _chunked(document_ids, chunk_size):
+        existing_ids = set(queryset.filter(id__in=ids).values_list("id", flat=True))
+        deleted_ids += [
+            project_id for project_id in ids if project_id not in existing_ids
+        ]
+
+    actions = chain(
+        ProjectDocument.get_indexing_actions(
+            queryset.filter(updated_at__gte=since), chunk_size=chunk_size
+        ),
+        ProjectDocument.get_deleting_actions(deleted_ids),
+    )
+    _, errors = bulk(
+        client,
+        (dict(action, _index=index_name) for action in actions),
+        chunk_size=chunk_size,
+        raise_on_error=False,
+        refresh="wait_for",
+    )
+    # Documents may have been removed by the indexing outbox in the meantime
+    errors = [
+        error for error in errors if not ProjectDocument.is_missing_document_error(error)
+    ]
+    if errors:
+        log(f"Catching up {index_name} failed for {len(errors)} documents", "error")
+    return len(deleted_ids)
+
+
+def delete_old_indices(client, alias: str, keep: int = 1) -> List[str]:
+    """
+    Delete the timestamped indices of the alias that it doesn't point to anymore,
+    except for the keep most recent ones.
+
+    Returns:
+        List[str]: The deleted indices.
+    """
+    current = set(get_alias_indices(client, alias))
+    names = sorted(
+        (
+            name
+            for name in client.indices.get(index=f"{alias}-*").keys()
+            if name not in current
+        ),
+        reverse=True,
+    )
+    deleted = names[keep:]
+    for name in deleted:
+        client.indices.delete(index=name)
+    return deleted
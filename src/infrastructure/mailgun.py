@@ -0,0 +1,196 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.utils import timezone
+
+from config import settings
+from config.logging import log
+
+from .models import EmailStatus
+
+POLLED_EVENTS = ("delivered", "failed", "opened")
+EVENTS_PAGE_LIMIT = 300
+
+# A status only moves forward, events received out of order can't revert it
+STATUS_RANKS = {
+    EmailStatus.Status.SENT: 0,
+    EmailStatus.Status.DELIVERED: 1,
+    EmailStatus.Status.FAILED: 2,
+    EmailStatus.Status.OPENED: 3,
+    EmailStatus.Status.IGNORED: 4,
+}
+
+
+@lru_cache(maxsize=None)
+def get_session() -> requests.Session:
+    """
+    Return a shared session, so the requests to Mailgun reuse their connections.
+    """
+    session = requests.Session()
+    session.auth = ("api", settings.ANYMAIL["MAILGUN_API_KEY"])
+    adapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=settings.MAILGUN_POLL_THREADS
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _events_url() -> str:
+    return (
+        f"{settings.ANYMAIL['MAILGUN_API_URL']}/"
+        f"{settings.ANYMAIL['MAILGUN_SENDER_DOMAIN']}/events"
+    )
+
+
+def iter_events(begin: datetime, end: datetime) -> Iterator[dict]:
+    """
+    Yield the polled events of the time window, following Mailgun's pagination.
+    """
+    url = _events_url()
+    params = {
+        "begin": begin.timestamp(),
+        "end": end.timestamp(),
+        "ascending": "yes",
+        "limit": EVENTS_PAGE_LIMIT,
+        "event": " OR ".join(POLLED_EVENTS),
+    }
+    while url:
+        response = get_session().get(
+            url, params=params, timeout=settings.MAILGUN_TIMEOUT
+        )
+        response.raise_for_status()
+        data = response.json()
+        items = data.get("items", [])
+        if not items:
+            return
+        yield from items
+        # The next page URL already contains the parameters
+        url, params = data.get("paging", {}).get("next"), None
+
+
+def fetch_events(begin: datetime, end: datetime) -> List[dict]:
+    """
+    Fetch the polled events between begin and end. The range is split into windows
+    of MAILGUN_EVENTS_WINDOW seconds, which are paginated concurrently.
+    """
+    window = timedelta(seconds=settings.MAILGUN_EVENTS_WINDOW)
+    windows = []
+    while begin < end:
+        windows.append((begin, min(begin + window, end)))
+        begin += window
+
+    with ThreadPoolExecutor(max_workers=settings.MAILGUN_POLL_THREADS) as executor:
+        pages = executor.map(lambda bounds: list(iter_events(*bounds)), windows)
+        return [event for page in pages for event in page]
+
+
+def _event_status(event: dict):
+    event_type = event.get("event")
+    if event_type == "opened":
+        return EmailStatus.Status.OPENED
+    if event_type == "delivered":
+        return EmailStatus.Status.DELIVERED
+    # Temporary failures are retried by Mailgun
+    if event_type == "failed" and event.get("severity") != "temporary":
+        return EmailStatus.Status.FAILED
+    return None
+
+
+def _event_message_id(event: dict) -> str:
+    message_id = event.get("message", {}).get("headers", {}).get("message-id", "")
+    # The API returns the id without the brackets anymail stores, like the webhook does
+    if message_id and not message_id.startswith("<"):
+        message_id = f"<{message_id}>"
+    return message_id
+
+
+def iter_status_updates(events: Iterable[dict]) -> Iterator[Tuple[str, str]]:
+    """
+    Yield the (message id, status) updates of Mailgun events.
+    """
+    for event in events:
+        status = _event_status(event)
+        message_id = _event_message_id(event)
+        if status and message_id:
+            yield message_id, status
+
+
+def apply_email_statuses(updates: Iterable[Tuple[str, str]]) -> int:
+    """
+    Apply (message id, status) updates to the matching email statuses with a single
+    bulk update. The owners of the sets are notified about newly opened emails.
+
+    Returns:
+        int: The number of updated email statuses.
+    """
+    new_statuses: Dict[str, str] = {}
+    for message_id, status in updates:
+        current = new_statuses.get(message_id)
+        if current is None or STATUS_RANKS[status] > STATUS_RANKS[current]:
+            new_statuses[message_id] = status
+    if not new_statuses:
+        return 0
+
+    now = timezone.now()
+    updated = []
+    opened = []
+    for email_status in EmailStatus.objects.filter(
+        email_id__in=new_statuses
+    ).select_related("project_set__user"):
+        status = new_statuses[email_status.email_id]
+        if STATUS_RANKS[status] <= STATUS_RANKS[email_status.status]:
+            continue
+        email_status.status = status
+        email_status.last_checked = now
+        updated.append(email_status)
+        if status == EmailStatus.Status.OPENED:
+            opened.append(email_status)
+
+    EmailStatus.objects.bulk_update(updated, ["status", "last_checked"])
+
+    from .tasks import send_open_notification_email
+
+    for email_status in opened:
+        send_open_notification_email.delay(
+            email_status.project_set.user.email, email_status.project_set.title
+        )
+    return len(updated)
+
+
+def poll_email_statuses() -> int:
+    """
+    Update the sent and delivered emails from the Mailgun events since the oldest
+    of them was sent. Emails older than EMAIL_STATUS_MAX_AGE days are ignored,
+    Mailgun doesn't keep their events anymore.
+
+    The statuses are pushed by the tracking webhook, this only reconciles the
+    emails whose webhook calls were lost.
+
+    Returns:
+        int: The number of updated email statuses.
+    """
+    now = timezone.now()
+    outstanding = EmailStatus.objects.filter(
+        status__in=[EmailStatus.Status.SENT, EmailStatus.Status.DELIVERED]
+    )
+    outstanding.filter(
+        created_at__lt=now - timedelta(days=settings.EMAIL_STATUS_MAX_AGE)
+    ).update(status=EmailStatus.Status.IGNORED, last_checked=now)
+
+    oldest = outstanding.order_by("created_at").values_list(
+        "created_at", flat=True
+    ).first()
+    if oldest is None:
+        return 0
+
+    try:
+        events = fetch_events(oldest, now)
+    except requests.RequestException as e:
+        log(f"Failed to fetch Mailgun events: {e}", "error")
+        return 0
+    return apply_email_statuses(iter_status_updates(events))
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.9 on 2026-10-18 12:00
+
+import hashlib
+import json
+
+from django.db import migrations, models
+
+
+def project_content_hash(
+    title, description, image, url, industry_ids, technology_ids
+):
+    # Copy of infrastructure.models.project_content_hash at the time of this
+    # migration, so later changes to it don't change what the migration computes
+    content = json.dumps(
+        [
+            title,
+            description,
+            image or "",
+            url or "",
+            sorted(industry_ids),
+            sorted(technology_ids),
+        ]
+    )
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def fill_content_hash(apps, schema_editor):
+    Project = apps.get_model("infrastructure", "Project")
+    projects = Project.objects.prefetch_related("industries", "technologies")
+    batch = []
+    for project in projects.iterator(chunk_size=1000):
+        project.content_hash = project_content_hash(
+            project.title,
+            project.description,
+            project.image.name,
+            project.url,
+            [industry.id for industry in project.industries.all()],
+            [technology.id for technology in project.technologies.all()],
+        )
+        batch.append(project)
+        if len(batch) >= 1000:
+            Project.objects.bulk_update(batch, ["content_hash"])
+            batch = []
+    Project.objects.bulk_update(batch, ["content_hash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('infrastructure', '0014_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, help_text='Fingerprint of the title, description, image, url and tags', max_length=64),
+        ),
+        migrations.RunPython(fill_content_hash, migrations.RunPython.noop),
+    ]
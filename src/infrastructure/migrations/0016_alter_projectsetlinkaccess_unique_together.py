@@ -0,0 +1,39 @@
+# Generated by Django 4.2.9 on 2026-10-18 12:00
+
+from django.db import migrations
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_accesses(apps, schema_editor):
+    ProjectSetLinkAccess = apps.get_model("infrastructure", "ProjectSetLinkAccess")
+    duplicates = (
+        ProjectSetLinkAccess.objects.values("project_set_id", "ip_address_hash")
+        .annotate(
+            count=Count("id"), first_id=Min("id"), total_views=Sum("view_count")
+        )
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        accesses = ProjectSetLinkAccess.objects.filter(
+            project_set_id=duplicate["project_set_id"],
+            ip_address_hash=duplicate["ip_address_hash"],
+        )
+        accesses.filter(id=duplicate["first_id"]).update(
+            view_count=duplicate["total_views"]
+        )
+        accesses.exclude(id=duplicate["first_id"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('infrastructure', '0015_project_content_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_accesses, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='projectsetlinkaccess',
+            unique_together={('project_set', 'ip_address_hash')},
+        ),
+    ]
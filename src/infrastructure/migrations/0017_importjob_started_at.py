@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('infrastructure', '0016_alter_projectsetlinkaccess_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,10 +1,33 @@
-from django.db import models
+import hashlib
+import json
+
+from django.db import models, transaction
 from django.urls import reverse
 from uuid import uuid4
 
 from config import settings
 
 
+def project_content_hash(
+    title, description, image, url, industry_ids, technology_ids
+) -> str:
+    """
+    Return the fingerprint of the content of a project, which is equal for a copy
+    and its original project as long as neither of them was changed.
+    """
+    content = json.dumps(
+        [
+            title,
+            description,
+            image or "",
+            url or "",
+            sorted(industry_ids),
+            sorted(technology_ids),
+        ]
+    )
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
 class Project(models.Model):
     class Meta:
         verbose_name_plural = "Projects"
@@ -25,26 +48,54 @@ class Project(models.Model):
     industries = models.ManyToManyField("Industry", related_name="projects")
     technologies = models.ManyToManyField("Technology", related_name="projects")
 
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        help_text="Fingerprint of the title, description, image, url and tags",
+    )
+
     @property
     def is_diff_from_original(self):
-        if not self.original_project:
+        if not self.original_project_id:
             return False
 
-        fields_to_compare = ["title", "description", "image", "url"]
-
-        for field in fields_to_compare:
-            if getattr(self, field) != getattr(self.original_project, field):
-                return True
-
-        if set(self.industries.all()) != set(self.original_project.industries.all()):
-            return True
-
-        if set(self.technologies.all()) != set(
-            self.original_project.technologies.all()
-        ):
-            return True
+        # Annotated by ProjectSet.objects.with_projects, to avoid loading the original
+        original_content_hash = getattr(self, "original_content_hash", None)
+        if original_content_hash is None:
+            original_content_hash = self.original_project.content_hash
+        return self.content_hash != original_content_hash
+
+    def compute_content_hash(self) -> str:
+        if self.pk:
+            industry_ids = self.industries.values_list("id", flat=True)
+            technology_ids = self.technologies.values_list("id", flat=True)
+        else:
+            # Tags can only be added once the project is saved
+            industry_ids = technology_ids = []
+        return project_content_hash(
+            self.title,
+            self.description,
+            self.image.name,
+            self.url,
+            industry_ids,
+            technology_ids,
+        )
 
-        return False
+    def refresh_content_hash(self):
+        """
+        Store the fingerprint of the project, must be called when its tags changed.
+        """
+        self.content_hash = self.compute_content_hash()
+        # Not saved, so updated_at doesn't change
+        Project.objects.filter(pk=self.pk).update(content_hash=self.content_hash)
+
+    def save(self, *args, **kwargs):
+        self.content_hash = self.compute_content_hash()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "content_hash"}
+        super().save(*args, **kwargs)
 
     def create_copy(self, user):
         copy = Project.objects.create(
@@ -103,6 +154,25 @@ class Company(models.Model):
         return self.title
 
 
+class ProjectSetQuerySet(models.QuerySet):
+    def with_projects(self):
+        """
+        Load the project sets together with everything their templates show:
+        the projects, their industries and technologies and the fingerprints of
+        the original projects used by is_diff_from_original, in a fixed number
+        of queries.
+        """
+        industries = Industry.objects.only("title")
+        technologies = Technology.objects.only("title")
+        projects = Project.objects.annotate(
+            original_content_hash=models.F("original_project__content_hash")
+        ).prefetch_related(
+            models.Prefetch("industries", queryset=industries),
+            models.Prefetch("technologies", queryset=technologies),
+        )
+        return self.prefetch_related(models.Prefetch("projects", queryset=projects))
+
+
 class ProjectSet(models.Model):
     class Meta:
         verbose_name_plural = "Project sets"
@@ -122,13 +192,45 @@ class ProjectSet(models.Model):
     download_count = models.PositiveIntegerField(default=0)
     shared_link_count = models.PositiveIntegerField(default=0)
 
+    objects = ProjectSetQuerySet.as_manager()
+
     def increment_download_count(self):
-        self.download_count += 1
-        self.save()
+        self._increment_counter("download_count")
 
     def increment_shared_link_count(self):
-        self.shared_link_count += 1
-        self.save()
+        self._increment_counter("shared_link_count")
+
+    def _increment_counter(self, field: str, amount: int = 1):
+        # Incremented in the database, so concurrent increments are not lost,
+        # only the counter column is written and updated_at is kept
+        ProjectSet.objects.filter(pk=self.pk).update(
+            **{field: models.F(field) + amount}
+        )
+        self.refresh_from_db(fields=[field])
+
+    def get_content_version(self) -> str:
+        """
+        Return a hash of everything shown for the set: its title, its projects'
+        content fingerprints and the titles of their tags, which can be renamed
+        without changing the projects.
+        """
+        projects = list(
+            self.projects.order_by("id").values_list("id", "content_hash")
+        )
+        project_ids = [project_id for project_id, _ in projects]
+        tags = [
+            list(
+                relation.objects.filter(project_id__in=project_ids)
+                .order_by("project_id", f"{tag_field}__title")
+                .values_list("project_id", f"{tag_field}__title")
+            )
+            for relation, tag_field in (
+                (Project.industries.through, "industry"),
+                (Project.technologies.through, "technology"),
+            )
+        ]
+        content = repr((self.title, projects, tags))
+        return hashlib.sha256(content.encode()).hexdigest()
 
     def get_link(self):
         if ProjectSetLink.objects.filter(project_set=self).exists():
@@ -143,6 +245,53 @@ class ProjectSet(models.Model):
         project_copy = project.create_copy(self.user)
         self.projects.add(project_copy)
 
+    def add_projects(self, projects):
+        """
+        Add copies of the projects to the set, with a fixed number of queries:
+        the copies and their industry and technology rows are bulk created in
+        one transaction.
+
+        Returns:
+            list: The created copies, in the order of the given projects.
+        """
+        projects = list(projects)
+        if not projects:
+            return []
+
+        with transaction.atomic():
+            copies = Project.objects.bulk_create(
+                Project(
+                    title=project.title,
+                    description=project.description,
+                    image=project.image,
+                    url=project.url,
+                    original_project=project,
+                    user=self.user,
+                    # Bulk created rows don't send m2m_changed, the tags are the same
+                    content_hash=project.content_hash,
+                )
+                for project in projects
+            )
+            copy_ids = {project.id: copy.id for project, copy in zip(projects, copies)}
+
+            for relation, tag_field in (
+                (Project.industries.through, "industry_id"),
+                (Project.technologies.through, "technology_id"),
+            ):
+                rows = relation.objects.filter(project_id__in=copy_ids).values_list(
+                    "project_id", tag_field
+                )
+                relation.objects.bulk_create(
+                    relation(project_id=copy_ids[project_id], **{tag_field: tag_id})
+                    for project_id, tag_id in rows
+                )
+
+            self.projects.through.objects.bulk_create(
+                self.projects.through(projectset_id=self.id, project_id=copy.id)
+                for copy in copies
+            )
+        return copies
+
     def __str__(self):
         return self.title
 
@@ -165,6 +314,9 @@ class ProjectSetLink(models.Model):
 
 
 class ProjectSetLinkAccess(models.Model):
+    class Meta:
+        unique_together = ("project_set", "ip_address_hash")
+
     project_set = models.ForeignKey(ProjectSet, on_delete=models.CASCADE)
     ip_address_hash = models.CharField(max_length=255)
     accessed_at = models.DateTimeField(auto_now_add=True)
@@ -201,3 +353,49 @@ class FilterUsage(models.Model):
 
     def __str__(self):
         return f"{self.filter_type}: {self.filter_value} ({self.usage_count})"
+
+
+class ImportJob(models.Model):
+    class Status(models.TextChoices):
+        PENDING = ("pending", "pending")
+        RUNNING = ("running", "running")
+        SUCCEEDED = ("succeeded", "succeeded")
+        FAILED = ("failed", "failed")
+
+    user = models.ForeignKey(
+        "accounts.User",
+        on_delete=models.CASCADE,
+        related_name="import_jobs",
+        help_text="Owner of the imported projects",
+    )
+    created_by = models.ForeignKey(
+        "accounts.User",
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="created_import_jobs",
+    )
+    file_path = models.CharField(max_length=255)
+    atomic = models.BooleanField(
+        default=True, help_text="Roll back the whole import if any row fails"
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.PENDING,
+    )
+    rows_processed = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    indexed_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def is_finished(self):
+        return self.status in (self.Status.SUCCEEDED, self.Status.FAILED)
+
+    def __str__(self):
+        return f"Import {self.id} ({self.status})"
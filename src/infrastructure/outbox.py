@@ -0,0 +1,85 @@
+from typing import Iterable
+
+from django.db import transaction
+from elasticsearch.helpers import bulk
+
+from config import settings
+from config.logging import log
+from config.redis import get_redis
+
+from .buffers import RedisBuffer
+from .cache import bump_index_generation
+from .elastic import ProjectDocument
+
+INDEXING_OUTBOX = RedisBuffer("indexing:outbox")
+
+
+def enqueue_project_indexing(user_id, project_ids: Iterable[int]):
+    """
+    Queue created, updated or deleted projects for indexing in Elasticsearch.
+
+    The ids are collected in Redis once the current transaction commits, and a task
+    applies all of them after INDEXING_OUTBOX_DELAY seconds, so bursts of writes end
+    up in a single bulk request. Deleted projects are removed from the index.
+
+    Args:
+        user_id: Owner of the projects, whose cached search results are invalidated.
+        project_ids (Iterable[int]): Ids of the changed projects.
+    """
+    project_ids = list(project_ids)
+    if not project_ids:
+        return
+
+    def enqueue():
+        from .tasks import process_indexing_outbox
+
+        get_redis().hset(
+            INDEXING_OUTBOX.pending_key,
+            mapping={project_id: user_id for project_id in project_ids},
+        )
+        INDEXING_OUTBOX.schedule(
+            process_indexing_outbox, settings.INDEXING_OUTBOX_DELAY
+        )
+
+    transaction.on_commit(enqueue)
+
+
+def process_indexing_outbox() -> int:
+    """
+    Apply the queued projects to Elasticsearch with a single bulk request:
+    existing projects are indexed, the others are deleted from the index.
+
+    Returns:
+        int: The number of applied projects.
+    """
+    with INDEXING_OUTBOX.take() as key:
+        if key is None:
+            return 0
+        queued = {
+            int(project_id): user_id
+            for project_id, user_id in get_redis().hgetall(key).items()
+        }
+
+        projects = ProjectDocument().get_queryset().filter(id__in=queued.keys())
+        indexed_ids = set(projects.values_list("id", flat=True))
+        actions = list(ProjectDocument.get_indexing_actions(projects))
+        actions += ProjectDocument.get_deleting_actions(queued.keys() - indexed_ids)
+
+        _, errors = bulk(
+            ProjectDocument._get_connection(),
+            actions,
+            raise_on_error=False,
+            refresh="wait_for",
+        )
+        errors = [
+            error
+            for error in errors
+            if not ProjectDocument.is_missing_document_error(error)
+        ]
+        if errors:
+            log(f"Indexing outbox errors: {errors}", "error")
+
+        for user_id in set(queued.values()):
+            bump_index_generation(user_id)
+
+    return len(queued)
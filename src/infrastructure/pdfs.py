@@ -0,0 +1,52 @@
+import os
+import tempfile
+
+from django.template.loader import render_to_string
+from weasyprint import HTML
+
+from config import settings
+
+from .models import ProjectSet
+
+
+def get_pdf_path(project_set_id, version: str) -> str:
+    return os.path.join(settings.PDF_CACHE_DIR, str(project_set_id), f"{version}.pdf")
+
+
+def render_project_set_pdf(project_set_id, version: str) -> str:
+    """
+    Render the PDF of the project set and store it under its content version.
+    PDFs of previous versions of the set are deleted.
+
+    Returns:
+        str: The path of the stored PDF.
+    """
+    path = get_pdf_path(project_set_id, version)
+    if os.path.exists(path):
+        return path
+
+    project_set = ProjectSet.objects.with_projects().get(id=project_set_id)
+    html_string = render_to_string(
+        "sets/pdf_template.html", {"project_set": project_set}
+    )
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Written to a temporary file first, so a partial PDF is never served
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            HTML(string=html_string).write_pdf(tmp_file)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+    for name in os.listdir(directory):
+        if name.endswith(".pdf") and name != os.path.basename(path):
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                # Deleted by a concurrent render
+                pass
+    return path
@@ -0,0 +1,52 @@
+import redis
+from anymail.signals import tracking
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+
+from config.logging import log
+
+from .email_events import TRACKING_EVENT_STATUSES, enqueue_email_status
+from .models import Project
+
+
+@receiver(m2m_changed, sender=Project.industries.through)
+@receiver(m2m_changed, sender=Project.technologies.through)
+def update_project_content_hash(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keep Project.content_hash up to date when the tags of projects change,
+    from either side of the relation.
+    """
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            instance.refresh_content_hash()
+        return
+
+    # The instance is a tag, the projects are only known before a clear
+    if action == "pre_clear":
+        instance._cleared_project_ids = list(
+            instance.projects.values_list("id", flat=True)
+        )
+        return
+    if action == "post_clear":
+        pk_set = getattr(instance, "_cleared_project_ids", [])
+    elif action not in ("post_add", "post_remove"):
+        return
+
+    for project in Project.objects.filter(pk__in=pk_set):
+        project.refresh_content_hash()
+
+
+@receiver(tracking)
+def queue_email_tracking_event(sender, event, esp_name, **kwargs):
+    """
+    Queue the status updates received by the signed Mailgun tracking webhook.
+    """
+    status = TRACKING_EVENT_STATUSES.get(event.event_type)
+    if status is None or not event.message_id:
+        return
+    try:
+        enqueue_email_status(event.message_id, status)
+    except redis.RedisError as e:
+        # Mailgun retries the webhook call when it fails
+        log(f"Failed to queue {esp_name} event {event.event_id}: {e}", "error")
+        raise
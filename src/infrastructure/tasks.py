@@ -1,9 +1,11 @@
 from celery import shared_task
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, send_mail
 from django.conf import settings
-import requests
 
+from infrastructure.counters import flush_filter_usage
+from infrastructure import imports
 from infrastructure.models import EmailStatus
+from infrastructure import access_log, email_events, mailgun, outbox, pdfs
 
 
 @shared_task
@@ -18,15 +20,18 @@ def send_open_notification_email(user_email, project_set_title):
 
 @shared_task
 def send_shared_set_email(user_email, subject, body, project_set_id):
-    email_id = send_mail(
+    message = EmailMessage(
         subject=subject,
-        message=body,
+        body=body,
         from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[user_email],
+        to=[user_email],
     )
+    message.send()
 
+    # The id Mailgun reports the events of the message with
+    anymail_status = getattr(message, "anymail_status", None)
     EmailStatus.objects.create(
-        email_id=email_id,
+        email_id=(anymail_status and anymail_status.message_id) or "",
         recipient_email=user_email,
         project_set_id=project_set_id,
     )
@@ -34,23 +39,39 @@ def send_shared_set_email(user_email, subject, body, project_set_id):
 
 @shared_task
 def check_email_statuses():
-    email_statuses = EmailStatus.objects.filter(status__in=["Sent", "Delivered"])
-    for email_status in email_statuses:
-        response = requests.get(
-            f"{settings.ANYMAIL['MAILGUN_API_KEY']}/{email_status.email_id}",
-            auth=("api", settings.ANYMAIL["MAILGUN_API_KEY"]),
-        )
-
-        if response.status_code == 200:
-            status = response.json().get("event")
-
-            if status == "opened":
-                send_open_notification_email.delay(
-                    email_status.project_set.user.email, email_status.project_set.title
-                )
-                email_status.status = EmailStatus.Status.OPENED
-                email_status.save()
-
-        else:
-            # Handle error
-            pass
+    mailgun.poll_email_statuses()
+
+
+@shared_task
+def flush_filter_usage_counts():
+    flush_filter_usage()
+
+
+@shared_task
+def process_indexing_outbox():
+    outbox.process_indexing_outbox()
+
+
+@shared_task
+def run_import_job(job_id):
+    imports.run_import_job(job_id)
+
+
+@shared_task
+def fail_stale_import_jobs():
+    imports.fail_stale_import_jobs()
+
+
+@shared_task
+def render_project_set_pdf(project_set_id, version):
+    pdfs.render_project_set_pdf(project_set_id, version)
+
+
+@shared_task
+def aggregate_project_set_views():
+    access_log.aggregate_project_set_views()
+
+
+@shared_task
+def process_email_events():
+    email_events.process_email_events()
@@ -1,11 +1,63 @@
+import hashlib
+import hmac
+import io
 import json
+import os
+import shutil
+import threading
+import time
 import uuid
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import redis
+from elasticsearch.helpers import bulk
+from elasticsearch_dsl import Search
+from django.contrib.admin.sites import site
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from unittest import mock
 from rest_framework import status
 
+from accounts.models import User
 from accounts.tests.test_views import BaseViewTests
+from config import settings
+from config.redis import get_redis
+from .access_log import PROJECT_SET_VIEWS_KEY, aggregate_project_set_views
+from .admin import ProjectAdmin, ProjectResource
+from .buffers import RedisBuffer
+from .cache import (
+    SEARCH_CACHE_STATS_KEY,
+    get_index_generation,
+    get_search_cache_stats,
+    search_cache_key,
+)
+from .elastic import (
+    ProjectDocument,
+    decode_page_token,
+    encode_page_token,
+    search_projects,
+)
+from .email_events import EMAIL_EVENTS
+from .exporters import iter_projects_csv
+from .imports import (
+    fail_stale_import_jobs,
+    index_imported_projects,
+    run_import_job,
+)
+from .importers import ProjectCSVImporter, iter_csv_batches
+from .indexing import catch_up_index
+from .mailgun import poll_email_statuses
+from .counters import FILTER_USAGE, flush_filter_usage, record_filter_usage
+from .outbox import INDEXING_OUTBOX, enqueue_project_indexing
 from .models import (
+    EmailStatus,
+    FilterUsage,
+    ImportJob,
     Industry,
     ProjectSet,
     ProjectSetLink,
@@ -35,23 +87,70 @@ class ProjectSetDetailViewTests(BaseViewTests):
         self.project_set_access = ProjectSetLinkAccess.objects.create(
             project_set=self.project_set, ip_address_hash="test-hash"
         )
+        get_redis().delete(
+            PROJECT_SET_VIEWS_KEY, f"project_sets:visitors:{self.project_set.id}"
+        )
 
-    @mock.patch("infrastructure.views.send_open_notification_email.delay")
+    @mock.patch("infrastructure.tasks.send_open_notification_email.delay")
     def test_get_project_set_detail(self, mock_send_task):
         mock_send_task.return_value = None
 
         self.client.force_login(self.u1)
-        response = self.client.get(
-            reverse(
-                "project_set",
-                kwargs={"project_set_id": self.project_set_link.uuid},
-            )
+        url = reverse(
+            "project_set", kwargs={"project_set_id": self.project_set_link.uuid}
         )
+        response = self.client.get(url)
+        self.client.get(url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        mock_send_task.assert_called_once_with(self.u1.email, self.project_set.title)
         self.assertTemplateUsed(response, "sets/set.html")
         self.assertEqual(response.context["project_set"], self.project_set)
+        # Views are only recorded in Redis until they are aggregated
+        self.assertEqual(ProjectSetLinkAccess.objects.count(), 1)
+        mock_send_task.assert_not_called()
+
+        self.assertEqual(aggregate_project_set_views(), 2)
+        mock_send_task.assert_called_once_with(self.u1.email, self.project_set.title)
+        access = ProjectSetLinkAccess.objects.exclude(ip_address_hash="test-hash").get()
+        self.assertEqual(access.view_count, 2)
+        self.project_set.refresh_from_db()
+        self.assertEqual(self.project_set.shared_link_count, 1)
+
+        # Known visitors are not counted or notified again
+        self.client.get(url)
+        self.assertEqual(aggregate_project_set_views(), 1)
+        mock_send_task.assert_called_once()
+        access.refresh_from_db()
+        self.assertEqual(access.view_count, 3)
+
+    def test_get_project_set_detail_not_modified(self):
+        url = reverse(
+            "project_set", kwargs={"project_set_id": self.project_set_link.uuid}
+        )
+        response = self.client.get(url)
+        etag = response["ETag"]
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Editing a project of the set changes the version of the page
+        self.project.title = "Updated Project"
+        self.project.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertContains(response, "Updated Project")
+
+        # So does renaming a tag, which doesn't touch the projects
+        technology = Technology.objects.first()
+        self.project.technologies.add(technology)
+        response = self.client.get(url)
+        etag = response["ETag"]
+        technology.title = "Renamed Technology"
+        technology.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertContains(response, "Renamed Technology")
 
     def test_delete_project_set(self):
         self.client.force_login(self.u1)
@@ -81,7 +180,11 @@ class ProjectSetDetailViewTests(BaseViewTests):
         self.assertEqual(response.json(), {"status": "success"})
         self.project_set.refresh_from_db()
         self.assertEqual(self.project_set.title, new_title)
-        self.assertIn(new_project, self.project_set.projects.all())
+        # The project is added as a copy, the projects not sent are removed
+        self.assertEqual(
+            list(self.project_set.projects.values_list("original_project", flat=True)),
+            [new_project.id],
+        )
 
         # negative test case
         response = self.client.put(
@@ -92,6 +195,55 @@ class ProjectSetDetailViewTests(BaseViewTests):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
 
+class DownloadPDFTests(BaseViewTests):
+    def setUp(self):
+        super(DownloadPDFTests, self).setUp()
+        self.project_set = ProjectSet.objects.create(
+            title="Test Project Set", user=self.u1
+        )
+        self.project = Project.objects.create(
+            user_id=self.u1.id, title="Test Project", description="Test Description"
+        )
+        self.project_set.projects.add(self.project)
+        self.addCleanup(
+            shutil.rmtree,
+            os.path.join(settings.PDF_CACHE_DIR, str(self.project_set.id)),
+            ignore_errors=True,
+        )
+
+    def download(self):
+        return self.client.get(
+            reverse("download_pdf", kwargs={"project_set_id": self.project_set.id})
+        )
+
+    def test_download_pdf_is_cached(self):
+        self.client.force_login(self.u1)
+        # Rendered by the eager task during the first request
+        response = self.download()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+
+        with mock.patch("infrastructure.pdfs.HTML") as mock_html:
+            response = self.download()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_html.assert_not_called()
+
+    def test_download_pdf_after_change(self):
+        self.client.force_login(self.u1)
+        version = self.project_set.get_content_version()
+        self.download()
+
+        self.project.technologies.add(Technology.objects.first())
+        new_version = self.project_set.get_content_version()
+        self.assertNotEqual(version, new_version)
+
+        with mock.patch("infrastructure.views.render_project_set_pdf.delay") as delay:
+            response = self.download()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        delay.assert_called_once_with(self.project_set.id, new_version)
+
+
 class ProjectViewTests(BaseViewTests):
     def setUp(self):
         super(ProjectViewTests, self).setUp()
@@ -164,7 +316,33 @@ class ProjectSetViewTests(BaseViewTests):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.json(), {"status": "success"})
         project_set = ProjectSet.objects.get(title="New Project Set")
-        self.assertIn(self.project, project_set.projects.all())
+        copy = project_set.projects.get()
+        self.assertEqual(copy.original_project, self.project)
+        self.assertEqual(copy.user, self.u1)
+
+    def test_add_projects_query_count(self):
+        technologies = list(Technology.objects.all()[:3])
+        industries = list(Industry.objects.all()[:2])
+        projects = []
+        for i in range(10):
+            project = Project.objects.create(
+                user_id=self.u1.id, title=f"Project {i}", description="Description"
+            )
+            project.technologies.set(technologies)
+            project.industries.set(industries)
+            projects.append(project)
+        project_set = ProjectSet.objects.create(title="Bulk Set", user=self.u1)
+
+        # The copies, then a select and a bulk insert per tag relation, then the set
+        # rows, in a savepoint
+        with self.assertNumQueries(8):
+            copies = project_set.add_projects(projects)
+
+        self.assertEqual(len(copies), 10)
+        for copy in project_set.projects.all():
+            self.assertFalse(copy.is_diff_from_original)
+            self.assertCountEqual(copy.technologies.all(), technologies)
+            self.assertCountEqual(copy.industries.all(), industries)
 
     def test_get_project_set_list(self):
         self.client.force_login(self.u1)
@@ -174,3 +352,893 @@ class ProjectSetViewTests(BaseViewTests):
         self.assertTemplateUsed(response, "sets/list_sets.html")
         self.assertIn("project_sets", response.context)
         self.assertEqual(len(response.context["project_sets"]), 1)
+
+    def test_with_projects_query_count(self):
+        technologies = list(Technology.objects.all()[:2])
+        self.project.technologies.set(technologies)
+        for i in range(3):
+            project_set = ProjectSet.objects.create(title=f"Set {i}", user=self.u1)
+            for _ in range(2):
+                project_set.add_project(self.project)
+
+        # Sets, projects with the fingerprints of their originals, and their tags
+        with self.assertNumQueries(4):
+            for project_set in ProjectSet.objects.filter(user=self.u1).with_projects():
+                for project in project_set.projects.all():
+                    self.assertFalse(project.is_diff_from_original)
+                    self.assertEqual(len(project.technologies.all()), 2)
+                    self.assertEqual(len(project.industries.all()), 0)
+
+
+class ProjectSetsLinksViewTests(BaseViewTests):
+    def create_project_sets(self, count):
+        for i in range(count):
+            project_set = ProjectSet.objects.create(title=f"Set {i}", user=self.u1)
+            if i % 2 == 0:
+                ProjectSetLink.objects.create(project_set=project_set)
+            EmailStatus.objects.create(
+                email_id=f"email-{project_set.id}",
+                recipient_email=f"recipient{i}@mail.com",
+                project_set=project_set,
+            )
+
+    def get_links(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            # The delete route shares the name, reverse() would return it
+            response = self.client.get("/project_links/", params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json(), len(queries)
+
+    def test_query_count_does_not_depend_on_sets(self):
+        self.client.force_login(self.u1)
+        self.create_project_sets(2)
+        _, query_count = self.get_links()
+
+        self.create_project_sets(6)
+        data, more_sets_query_count = self.get_links()
+
+        self.assertEqual(query_count, more_sets_query_count)
+        self.assertEqual(len(data["project_sets"]), 8)
+        first, second = data["project_sets"][:2]
+        self.assertEqual(len(first["links"]), 1)
+        self.assertEqual(second["links"], [])
+        self.assertEqual(
+            first["email_statuses"],
+            [{"recipient_email": "recipient0@mail.com", "status": "sent"}],
+        )
+
+    def test_paginated_links(self):
+        self.client.force_login(self.u1)
+        self.create_project_sets(5)
+
+        data, _ = self.get_links(page=2, size=2)
+
+        self.assertEqual(
+            [project_set["title"] for project_set in data["project_sets"]],
+            ["Set 2", "Set 3"],
+        )
+        self.assertEqual(data["pagination"]["total"], 5)
+        self.assertEqual(data["pagination"]["num_pages"], 3)
+        self.assertTrue(data["pagination"]["has_next"])
+
+    def test_invalid_page_size(self):
+        self.client.force_login(self.u1)
+        self.create_project_sets(2)
+
+        data, _ = self.get_links(page=1, size="many")
+        self.assertEqual(data["pagination"]["size"], settings.DEFAULT_SIZE_PAGE)
+        data, _ = self.get_links(page=1, size=0)
+        self.assertEqual(data["pagination"]["size"], 1)
+
+
+class ProjectSetCounterTests(BaseViewTests):
+    def test_increment_counters(self):
+        project_set = ProjectSet.objects.create(title="Test Project Set", user=self.u1)
+        stale_project_set = ProjectSet.objects.get(id=project_set.id)
+
+        project_set.increment_download_count()
+        stale_project_set.increment_download_count()
+        stale_project_set.increment_shared_link_count()
+
+        self.assertEqual(stale_project_set.download_count, 2)
+        project_set.refresh_from_db()
+        self.assertEqual(project_set.download_count, 2)
+        self.assertEqual(project_set.shared_link_count, 1)
+        self.assertEqual(project_set.updated_at, stale_project_set.updated_at)
+
+
+class ProjectContentHashTests(BaseViewTests):
+    def setUp(self):
+        super(ProjectContentHashTests, self).setUp()
+        self.project = Project.objects.create(
+            user_id=self.u1.id, title="Test Project", description="Test Description"
+        )
+        self.project.technologies.set(Technology.objects.all()[:2])
+        self.copy = self.project.create_copy(self.u1)
+
+    def test_copy_is_not_diff_from_original(self):
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.content_hash, self.project.content_hash)
+        self.assertFalse(self.copy.is_diff_from_original)
+
+    def test_changed_fields(self):
+        self.copy.title = "Changed title"
+        self.copy.save()
+
+        self.assertTrue(Project.objects.get(id=self.copy.id).is_diff_from_original)
+
+    def test_changed_tags(self):
+        industry = Industry.objects.first()
+        self.copy.industries.add(industry)
+        self.assertTrue(Project.objects.get(id=self.copy.id).is_diff_from_original)
+
+        # Changed from the tag's side of the relation
+        industry.projects.remove(self.copy)
+        self.assertFalse(Project.objects.get(id=self.copy.id).is_diff_from_original)
+
+
+class FilterUsageCounterTests(BaseViewTests):
+    def setUp(self):
+        super(FilterUsageCounterTests, self).setUp()
+        get_redis().delete(FILTER_USAGE.pending_key, FILTER_USAGE.processing_key)
+
+    def test_record_filter_usage_does_not_write(self):
+        with self.assertNumQueries(0):
+            record_filter_usage("technology", ["Python", "Django"])
+        self.assertFalse(FilterUsage.objects.exists())
+
+    def test_flush_filter_usage(self):
+        FilterUsage.objects.create(
+            filter_type="technology", filter_value="Python", usage_count=3
+        )
+        record_filter_usage("technology", ["Python", "Django"])
+        record_filter_usage("technology", ["Python"])
+        record_filter_usage("industry", ["Energy"])
+
+        self.assertEqual(flush_filter_usage(), 3)
+
+        counts = {
+            (usage.filter_type, usage.filter_value): usage.usage_count
+            for usage in FilterUsage.objects.all()
+        }
+        self.assertEqual(
+            counts,
+            {
+                ("technology", "Python"): 5,
+                ("technology", "Django"): 1,
+                ("industry", "Energy"): 1,
+            },
+        )
+        self.assertEqual(flush_filter_usage(), 0)
+
+    def test_popular_filters_view_when_flush_fails(self):
+        FilterUsage.objects.create(
+            filter_type="technology", filter_value="Python", usage_count=3
+        )
+        admin = User.objects.create_superuser("admin@mail.com", "Admin", "demo")
+        self.client.force_login(admin)
+
+        # E.g. a periodic flush holds the lock
+        with mock.patch(
+            "infrastructure.views.flush_filter_usage",
+            side_effect=redis.exceptions.LockError("Unable to acquire lock"),
+        ):
+            response = self.client.get(reverse("popular_filters"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [usage.filter_value for usage in response.context["popular_technologies"]],
+            ["Python"],
+        )
+
+
+class SearchCacheKeyTests(SimpleTestCase):
+    def test_search_cache_key_ignores_filter_order(self):
+        params = {"search_string": "shop", "page": 1, "size": 10}
+        self.assertEqual(
+            search_cache_key(
+                1,
+                "gen",
+                {**params, "technology_filters": ["Python", "Django"]},
+            ),
+            search_cache_key(
+                1,
+                "gen",
+                {**params, "technology_filters": ["Django", "Python"]},
+            ),
+        )
+
+    def test_search_cache_key_is_scoped_to_generation(self):
+        params = {"search_string": "shop", "page": 1, "size": 10}
+        self.assertNotEqual(
+            search_cache_key(1, "gen", params), search_cache_key(1, "next", params)
+        )
+        self.assertNotEqual(
+            search_cache_key(1, "gen", params), search_cache_key(2, "gen", params)
+        )
+
+
+class PageTokenTests(SimpleTestCase):
+    def test_decode_page_token(self):
+        token = encode_page_token("pit-id", [1.5, 42], 3)
+        self.assertEqual(
+            decode_page_token(token), {"pit": "pit-id", "after": [1.5, 42], "page": 3}
+        )
+        self.assertIsNotNone(decode_page_token(encode_page_token(None, ["a", 1], 2)))
+
+    def test_decode_tampered_page_token(self):
+        for pit, after, page in (
+            ({"id": "pit"}, [1.5, 42], 3),
+            ("pit-id", [1.5], 3),
+            ("pit-id", [1.5, 42, 7], 3),
+            ("pit-id", [1.5, "42"], 3),
+            ("pit-id", [[1], 42], 3),
+            ("pit-id", [1.5, 42], 0),
+        ):
+            self.assertIsNone(decode_page_token(encode_page_token(pit, after, page)))
+        self.assertIsNone(decode_page_token("not a token"))
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class SearchCacheTests(BaseViewTests):
+    def setUp(self):
+        super(SearchCacheTests, self).setUp()
+        cache.clear()
+        get_redis().delete(SEARCH_CACHE_STATS_KEY)
+        self.technologies = list(Technology.objects.order_by("id")[:2])
+        self.projects = []
+        for i in range(2):
+            project = Project.objects.create(
+                user_id=self.u1.id, title=f"Project {i}", description="Description"
+            )
+            project.technologies.set(self.technologies[: i + 1])
+            self.projects.append(project)
+        bulk(self.es, ProjectDocument.get_indexing_actions(Project.objects.all()))
+        self.es.indices.refresh(index=self.index_name)
+
+    def search(self, **kwargs):
+        """
+        Run search_projects and return its results with the bodies of the search
+        requests sent to Elasticsearch.
+        """
+        with mock.patch.object(
+            Search, "execute", autospec=True, side_effect=Search.execute
+        ) as execute:
+            results = search_projects(self.u1, **kwargs)
+        return results, [call.args[0].to_dict() for call in execute.call_args_list]
+
+    def test_cached_facets_skip_overall_aggregation(self):
+        _, (request,) = self.search(search_string="Project")
+        self.assertIn("overall", request["aggs"])
+
+        technology = self.technologies[1].title
+        results, (request,) = self.search(technology_filters=[technology])
+        self.assertNotIn("overall", request["aggs"])
+        self.assertIn("technologies", request["aggs"])
+        self.assertEqual(results["total"], 1)
+        self.assertEqual(results["overall_project_count"], 2)
+
+    def test_unfiltered_search_with_cached_facets(self):
+        self.search(search_string="Project")
+
+        results, (request,) = self.search(size=1)
+        self.assertNotIn("aggs", request)
+        self.assertEqual(
+            results["facets"]["technologies"][self.technologies[0].title],
+            {"count": 2, "overall_count": 2},
+        )
+
+    def test_repeated_search_is_served_from_cache(self):
+        results, requests = self.search(search_string="Project")
+        self.assertEqual(len(requests), 1)
+
+        with mock.patch.object(
+            ProjectDocument, "mget", wraps=ProjectDocument.mget
+        ) as mget:
+            cached_results, requests = self.search(search_string="Project")
+
+        self.assertEqual(requests, [])
+        mget.assert_called_once()
+        self.assertEqual(
+            [hit.meta.id for hit in cached_results["data"]],
+            [hit.meta.id for hit in results["data"]],
+        )
+        self.assertEqual(cached_results["total"], results["total"])
+        self.assertEqual(cached_results["facets"], results["facets"])
+
+    def test_search_cache_stats(self):
+        self.search(search_string="Project")
+        self.search(search_string="Project")
+        self.search(search_string="Project")
+        expected_stats = {"hits": 2, "misses": 1, "hit_ratio": 2 / 3}
+        self.assertEqual(get_search_cache_stats(), expected_stats)
+
+        admin = User.objects.create_superuser("admin@mail.com", "Admin", "demo")
+        self.client.force_login(admin)
+        response = self.client.get(reverse("search_cache_stats"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["stats"], expected_stats)
+
+    def test_search_cache_stats_requires_staff(self):
+        self.client.force_login(self.u1)
+        response = self.client.get(reverse("search_cache_stats"))
+
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+
+    def test_index_writes_bump_generation(self):
+        get_redis().delete(
+            INDEXING_OUTBOX.pending_key,
+            INDEXING_OUTBOX.processing_key,
+            INDEXING_OUTBOX.scheduled_key,
+        )
+        generation = get_index_generation(self.u1.id)
+        # The outbox task runs eagerly, as soon as the ids are queued
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue_project_indexing(self.u1.id, [self.projects[0].id])
+        self.assertNotEqual(get_index_generation(self.u1.id), generation)
+
+        generation = get_index_generation(self.u1.id)
+        job = ImportJob.objects.create(
+            user=self.u1, created_by=self.u1, file_path="/tmp/missing.csv"
+        )
+        index_imported_projects(job, [self.projects[1].id])
+        self.assertNotEqual(get_index_generation(self.u1.id), generation)
+
+
+class ProjectIndexingActionsTests(BaseViewTests):
+    def test_get_indexing_actions_query_count(self):
+        technologies = list(Technology.objects.all()[:3])
+        industries = list(Industry.objects.all()[:2])
+        for i in range(20):
+            project = Project.objects.create(
+                user_id=self.u1.id, title=f"Project {i}", description="Description"
+            )
+            project.technologies.set(technologies)
+            project.industries.set(industries)
+
+        # One query for the projects and one per many-to-many relation
+        with self.assertNumQueries(3):
+            actions = list(
+                ProjectDocument.get_indexing_actions(Project.objects.all())
+            )
+
+        self.assertEqual(len(actions), 20)
+        source = actions[0]["_source"]
+        self.assertCountEqual(
+            source["technologies"], [technology.title for technology in technologies]
+        )
+        self.assertCountEqual(
+            source["industries"], [industry.title for industry in industries]
+        )
+        self.assertEqual(source["user"], {"id": self.u1.id})
+
+
+class RedisBufferTests(SimpleTestCase):
+    def setUp(self):
+        self.buffer = RedisBuffer(f"test_buffer:{uuid.uuid4().hex}")
+        self.addCleanup(
+            get_redis().delete,
+            self.buffer.pending_key,
+            self.buffer.processing_key,
+            self.buffer.scheduled_key,
+        )
+
+    def test_schedule_once_per_window(self):
+        task = mock.Mock()
+        self.buffer.schedule(task, 5)
+        self.buffer.schedule(task, 5)
+        task.apply_async.assert_called_once_with(countdown=5)
+
+        # A run resets the window
+        with self.buffer.take():
+            pass
+        self.buffer.schedule(task, 5)
+        self.assertEqual(task.apply_async.call_count, 2)
+
+    def test_take_keeps_items_of_failed_run(self):
+        client = get_redis()
+        with self.buffer.take() as key:
+            self.assertIsNone(key)
+
+        client.rpush(self.buffer.pending_key, "a")
+        with self.assertRaises(ValueError):
+            with self.buffer.take() as key:
+                raise ValueError()
+
+        client.rpush(self.buffer.pending_key, "b")
+        with self.buffer.take() as key:
+            self.assertEqual(client.lrange(key, 0, -1), ["a"])
+        with self.buffer.take() as key:
+            self.assertEqual(client.lrange(key, 0, -1), ["b"])
+        self.assertFalse(client.exists(self.buffer.processing_key))
+
+
+class IndexingOutboxTests(BaseViewTests):
+    def setUp(self):
+        super(IndexingOutboxTests, self).setUp()
+        get_redis().delete(
+            INDEXING_OUTBOX.pending_key,
+            INDEXING_OUTBOX.processing_key,
+            INDEXING_OUTBOX.scheduled_key,
+        )
+        self.technologies = list(Technology.objects.order_by("id")[:2])
+        self.projects = []
+        for i in range(2):
+            project = Project.objects.create(
+                user_id=self.u1.id, title=f"Project {i}", description="Description"
+            )
+            project.technologies.set(self.technologies)
+            self.projects.append(project)
+
+    def test_outbox_indexes_and_deletes_projects(self):
+        # The task runs eagerly, as soon as the ids are queued
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue_project_indexing(self.u1.id, [p.id for p in self.projects])
+
+        document = self.es.get(index=self.index_name, id=self.projects[0].id)
+        self.assertCountEqual(
+            document["_source"]["technologies"],
+            [technology.title for technology in self.technologies],
+        )
+        self.assertTrue(self.es.exists(index=self.index_name, id=self.projects[1].id))
+
+        deleted_id = self.projects[1].id
+        self.projects[1].delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue_project_indexing(self.u1.id, [deleted_id])
+
+        self.assertFalse(self.es.exists(index=self.index_name, id=deleted_id))
+        self.assertTrue(self.es.exists(index=self.index_name, id=self.projects[0].id))
+        self.assertFalse(get_redis().exists(INDEXING_OUTBOX.processing_key))
+
+
+class ReindexCatchUpTests(BaseViewTests):
+    def test_catch_up_index(self):
+        projects = [
+            Project.objects.create(
+                user_id=self.u1.id, title=f"Project {i}", description="Description"
+            )
+            for i in range(3)
+        ]
+        bulk(self.es, ProjectDocument.get_indexing_actions(Project.objects.all()))
+        self.es.indices.refresh(index=self.index_name)
+
+        # Writes made while the new index was loaded
+        since = timezone.now()
+        projects[0].title = "Renamed project"
+        projects[0].save()
+        deleted_id = projects[1].id
+        projects[1].delete()
+
+        deleted = catch_up_index(self.es, self.index_name, since, chunk_size=2)
+
+        self.assertEqual(deleted, 1)
+        self.assertFalse(self.es.exists(index=self.index_name, id=deleted_id))
+        document = self.es.get(index=self.index_name, id=projects[0].id)
+        self.assertEqual(document["_source"]["title"], "Renamed project")
+        self.assertTrue(self.es.exists(index=self.index_name, id=projects[2].id))
+
+
+class ProjectAdminDeleteTests(BaseViewTests):
+    def setUp(self):
+        super(ProjectAdminDeleteTests, self).setUp()
+        self.projects = [
+            Project.objects.create(
+                user_id=self.u1.id, title=f"Project {i}", description="Description"
+            )
+            for i in range(3)
+        ]
+        # The last project is not indexed, deleting it must not fail
+        bulk(
+            self.es,
+            ProjectDocument.get_indexing_actions(
+                Project.objects.filter(id__in=[p.id for p in self.projects[:2]])
+            ),
+        )
+        self.es.indices.refresh(index=self.index_name)
+        self.request = RequestFactory().post("/")
+        self.request.user = self.u1
+
+    @mock.patch.object(ProjectAdmin, "message_user")
+    def test_delete_queryset(self, mock_message_user):
+        project_admin = ProjectAdmin(Project, site)
+        with self.captureOnCommitCallbacks(execute=True):
+            project_admin.delete_queryset(self.request, Project.objects.all())
+
+        self.assertFalse(Project.objects.exists())
+        for project in self.projects:
+            self.assertFalse(self.es.exists(index=self.index_name, id=project.id))
+        mock_message_user.assert_called_once_with(
+            self.request, "Successfully deleted 3 projects and their indexes."
+        )
+
+
+class ProjectAdminExportTests(BaseViewTests):
+    def setUp(self):
+        super(ProjectAdminExportTests, self).setUp()
+        self.technologies = list(Technology.objects.order_by("id")[:2])
+        for i in range(5):
+            project = Project.objects.create(
+                user_id=self.u1.id, title=f"Project {i}", description="Description"
+            )
+            project.technologies.set(self.technologies)
+        other_user = User.objects.create_user("other@mail.com", "Jane Doe", "demo")
+        Project.objects.create(
+            user_id=other_user.id, title="Other project", description="Description"
+        )
+
+    def test_iter_projects_csv_query_count(self):
+        # One query for the projects and one per many-to-many relation
+        with self.assertNumQueries(3):
+            lines = list(iter_projects_csv(Project.objects.all()))
+
+        self.assertEqual(lines[0], "title;description;url;industries;technologies\r\n")
+        self.assertEqual(len(lines), 7)
+
+    def test_export_action_streams_user_projects(self):
+        request = RequestFactory().post("/", {"user": self.u1.id})
+        request.user = self.u1
+        response = ProjectAdmin(Project, site).export_action(request)
+
+        self.assertTrue(response.streaming)
+        content = b"".join(response.streaming_content).decode()
+        rows = list(iter_csv_batches(io.StringIO(content), batch_size=10))[0]
+        self.assertEqual(len(rows), 5)
+        self.assertCountEqual(
+            rows["technologies"][0].split(","),
+            [technology.title for technology in self.technologies],
+        )
+
+
+class ProjectCSVImporterTests(BaseViewTests):
+    csv_content = "title;description;url;industries;technologies\n" + "".join(
+        f"Project {i};Description {i};;Energy;Docker,Quantum Widgets\n"
+        for i in range(5)
+    )
+
+    def test_iter_csv_batches(self):
+        batches = list(iter_csv_batches(io.StringIO(self.csv_content), batch_size=2))
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(batches[2]["title"], ["Project 4"])
+
+    def test_import_in_batches(self):
+        progress = mock.Mock()
+        importer = ProjectCSVImporter(
+            user_id=self.u1.id, batch_size=2, progress=progress
+        )
+        importer.run(io.StringIO(self.csv_content))
+
+        self.assertFalse(importer.has_errors)
+        self.assertEqual(importer.rows_processed, 5)
+        self.assertEqual(importer.totals["new"], 5)
+        self.assertEqual(progress.call_count, 3)
+        self.assertEqual(
+            importer.project_ids,
+            set(Project.objects.filter(user=self.u1).values_list("id", flat=True)),
+        )
+
+    def test_dry_run_writes_nothing(self):
+        importer = ProjectCSVImporter(user_id=self.u1.id, batch_size=2, dry_run=True)
+        importer.run(io.StringIO(self.csv_content))
+
+        self.assertEqual(importer.totals["new"], 5)
+        self.assertFalse(Project.objects.exists())
+        self.assertFalse(Technology.objects.filter(title="Quantum Widgets").exists())
+
+    def test_atomic_import_rolls_back_on_error(self):
+        before_import_row = ProjectResource.before_import_row
+
+        def fail_on_project_3(resource, row, *args, **kwargs):
+            if row["title"] == "Project 3":
+                raise ValueError("Invalid project")
+            return before_import_row(resource, row, *args, **kwargs)
+
+        importer = ProjectCSVImporter(user_id=self.u1.id, batch_size=2, atomic=True)
+        with mock.patch.object(
+            ProjectResource,
+            "before_import_row",
+            autospec=True,
+            side_effect=fail_on_project_3,
+        ):
+            importer.run(io.StringIO(self.csv_content))
+
+        self.assertTrue(importer.has_errors)
+        self.assertEqual(importer.rows_processed, 5)
+        self.assertEqual(importer.errors[0]["row"], 4)
+        self.assertEqual(importer.project_ids, set())
+        self.assertFalse(Project.objects.exists())
+
+
+class ImportJobViewTests(BaseViewTests):
+    def setUp(self):
+        super(ImportJobViewTests, self).setUp()
+        self.job = ImportJob.objects.create(
+            user=self.u1,
+            created_by=self.u1,
+            file_path="/tmp/missing.csv",
+            status=ImportJob.Status.SUCCEEDED,
+            rows_processed=10,
+            created_count=8,
+            error_count=2,
+            indexed_count=8,
+            errors=[{"row": 3, "message": "Invalid project"}],
+        )
+
+    def test_import_job_progress(self):
+        self.client.force_login(self.u1)
+        response = self.client.get(reverse("import_job", args=[self.job.id]))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        job = response.json()["job"]
+        self.assertTrue(job["finished"])
+        self.assertEqual(job["rows_processed"], 10)
+        self.assertEqual(job["indexed_count"], 8)
+        self.assertEqual(job["errors"][0]["row"], 3)
+
+    def test_import_job_of_other_user(self):
+        other_user = User.objects.create_user("other@mail.com", "Jane Doe", "demo")
+        self.client.force_login(other_user)
+        response = self.client.get(reverse("import_job", args=[self.job.id]))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class StaleImportJobTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("user@mail.com", "John Doe", "demo")
+        self.files_dir = f"/tmp/imports-{uuid.uuid4().hex}"
+        os.makedirs(self.files_dir)
+        self.addCleanup(shutil.rmtree, self.files_dir)
+
+    def create_job(self, **kwargs):
+        file_path = os.path.join(self.files_dir, f"{uuid.uuid4().hex}.csv")
+        with open(file_path, "w") as stream:
+            stream.write("title\n")
+        return ImportJob.objects.create(
+            user=self.user, created_by=self.user, file_path=file_path, **kwargs
+        )
+
+    def test_stale_running_job_fails(self):
+        stale_job = self.create_job(
+            status=ImportJob.Status.RUNNING,
+            started_at=timezone.now()
+            - timedelta(seconds=settings.IMPORT_JOB_TIMEOUT + 1),
+            rows_processed=5,
+        )
+        running_job = self.create_job(
+            status=ImportJob.Status.RUNNING, started_at=timezone.now()
+        )
+
+        self.assertEqual(fail_stale_import_jobs(), 1)
+
+        stale_job.refresh_from_db()
+        self.assertEqual(stale_job.status, ImportJob.Status.FAILED)
+        self.assertTrue(stale_job.is_finished)
+        self.assertIsNotNone(stale_job.finished_at)
+        self.assertEqual(stale_job.error_count, 1)
+        self.assertEqual(stale_job.errors[0]["row"], 5)
+        self.assertFalse(os.path.exists(stale_job.file_path))
+        running_job.refresh_from_db()
+        self.assertEqual(running_job.status, ImportJob.Status.RUNNING)
+        self.assertTrue(os.path.exists(running_job.file_path))
+
+    def test_stale_pending_job_fails(self):
+        job = self.create_job()
+        ImportJob.objects.filter(id=job.id).update(
+            created_at=timezone.now()
+            - timedelta(seconds=settings.IMPORT_JOB_TIMEOUT + 1)
+        )
+
+        self.assertEqual(fail_stale_import_jobs(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.Status.FAILED)
+        self.assertFalse(os.path.exists(job.file_path))
+        # A late delivery of its task doesn't run the failed job
+        self.assertEqual(run_import_job(job.id).status, ImportJob.Status.FAILED)
+
+
+class MailgunEventsHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in for Mailgun's events API, serving the events of the server in pages
+    of one event.
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        events = [
+            event
+            for event in self.server.events
+            if float(query["begin"]) <= event["timestamp"] < float(query["end"])
+        ]
+        self.server.requests.append(query)
+
+        offset = int(query.get("offset", 0))
+        next_query = {**query, "offset": offset + 1}
+        next_url = f"http://{self.headers['Host']}{url.path}?" + "&".join(
+            f"{key}={value}" for key, value in next_query.items()
+        )
+        body = json.dumps(
+            {"items": events[offset : offset + 1], "paging": {"next": next_url}}
+        ).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class MailgunPollingTests(BaseViewTests):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), MailgunEventsHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        super(MailgunPollingTests, self).setUp()
+        self.server.events = []
+        self.server.requests = []
+        self.project_set = ProjectSet.objects.create(
+            title="Test Project Set", user=self.u1
+        )
+        # Stored as anymail returns it, the events API omits the brackets
+        self.statuses = [
+            EmailStatus.objects.create(
+                email_id=f"<message-{i}@mail.com>",
+                recipient_email=f"recipient{i}@mail.com",
+                project_set=self.project_set,
+            )
+            for i in range(3)
+        ]
+        patcher = mock.patch.dict(
+            settings.ANYMAIL,
+            {
+                "MAILGUN_API_URL": f"http://127.0.0.1:{self.server.server_port}/v3",
+                "MAILGUN_SENDER_DOMAIN": "mail.com",
+            },
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_event(self, event, message_id, **extra):
+        self.server.events.append(
+            {
+                "event": event,
+                "timestamp": timezone.now().timestamp(),
+                "message": {"headers": {"message-id": message_id}},
+                **extra,
+            }
+        )
+
+    @mock.patch("infrastructure.tasks.send_open_notification_email.delay")
+    def test_poll_email_statuses(self, mock_send_task):
+        self.add_event("delivered", "message-0@mail.com")
+        self.add_event("opened", "message-0@mail.com")
+        self.add_event("delivered", "message-1@mail.com")
+        self.add_event("failed", "message-2@mail.com", severity="temporary")
+        self.add_event("opened", "unknown@mail.com")
+
+        with mock.patch.object(settings, "MAILGUN_EVENTS_WINDOW", 60):
+            self.assertEqual(poll_email_statuses(), 2)
+
+        statuses = {
+            email_status.email_id: email_status.status
+            for email_status in EmailStatus.objects.all()
+        }
+        self.assertEqual(
+            statuses,
+            {
+                "<message-0@mail.com>": EmailStatus.Status.OPENED,
+                "<message-1@mail.com>": EmailStatus.Status.DELIVERED,
+                "<message-2@mail.com>": EmailStatus.Status.SENT,
+            },
+        )
+        mock_send_task.assert_called_once_with(self.u1.email, self.project_set.title)
+        self.assertEqual(
+            self.server.requests[0]["event"], "delivered OR failed OR opened"
+        )
+
+        # Events already applied don't change anything
+        self.assertEqual(poll_email_statuses(), 0)
+        mock_send_task.assert_called_once()
+
+    def test_poll_ignores_old_email_statuses(self):
+        EmailStatus.objects.filter(id=self.statuses[0].id).update(
+            created_at=timezone.now()
+            - timedelta(days=settings.EMAIL_STATUS_MAX_AGE + 1)
+        )
+
+        poll_email_statuses()
+
+        self.statuses[0].refresh_from_db()
+        self.assertEqual(self.statuses[0].status, EmailStatus.Status.IGNORED)
+        # Only the window since the oldest outstanding email is requested
+        begin = min(float(query["begin"]) for query in self.server.requests)
+        self.assertGreaterEqual(begin, self.statuses[1].created_at.timestamp() - 1)
+
+
+class EmailTrackingWebhookTests(BaseViewTests):
+    def setUp(self):
+        super(EmailTrackingWebhookTests, self).setUp()
+        get_redis().delete(
+            EMAIL_EVENTS.pending_key,
+            EMAIL_EVENTS.processing_key,
+            EMAIL_EVENTS.scheduled_key,
+        )
+        self.project_set = ProjectSet.objects.create(
+            title="Test Project Set", user=self.u1
+        )
+        # Stored as anymail returns it, the webhook adds the brackets as well
+        self.email_status = EmailStatus.objects.create(
+            email_id="<message-0@mail.com>",
+            recipient_email="recipient@mail.com",
+            project_set=self.project_set,
+        )
+
+    def post_event(self, event, signing_key=None):
+        timestamp = str(int(time.time()))
+        token = uuid.uuid4().hex
+        signature = hmac.new(
+            (signing_key or settings.MAILGUN_WEBHOOK_SIGNING_KEY).encode(),
+            f"{timestamp}{token}".encode(),
+            hashlib.sha256,
+        ).hexdigest()
+        payload = {
+            "signature": {
+                "timestamp": timestamp,
+                "token": token,
+                "signature": signature,
+            },
+            "event-data": {
+                "id": uuid.uuid4().hex,
+                "event": event,
+                "timestamp": time.time(),
+                "recipient": "recipient@mail.com",
+                "message": {"headers": {"message-id": "message-0@mail.com"}},
+            },
+        }
+        # Mailgun's calls are not logged in
+        self.client.logout()
+        return self.client.post(
+            "/anymail/mailgun/tracking/",
+            data=json.dumps(payload),
+            content_type="application/json",
+        )
+
+    @mock.patch("infrastructure.tasks.send_open_notification_email.delay")
+    def test_webhook_applies_events(self, mock_send_task):
+        # The batch task runs eagerly in tests
+        response = self.post_event("opened")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.email_status.refresh_from_db()
+        self.assertEqual(self.email_status.status, EmailStatus.Status.OPENED)
+        mock_send_task.assert_called_once_with(self.u1.email, self.project_set.title)
+
+        # A late delivered event doesn't revert the status
+        self.post_event("delivered")
+        self.email_status.refresh_from_db()
+        self.assertEqual(self.email_status.status, EmailStatus.Status.OPENED)
+
+    def test_webhook_rejects_invalid_signature(self):
+        response = self.post_event("opened", signing_key="wrong-key")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(get_redis().llen(EMAIL_EVENTS.pending_key), 0)
+        self.email_status.refresh_from_db()
+        self.assertEqual(self.email_status.status, EmailStatus.Status.SENT)
@@ -4,6 +4,12 @@ from . import views
 
 urlpatterns = [
     path("admin/popular-filters/", views.popular_filters_view, name="popular_filters"),
+    path(
+        "admin/search-cache-stats/",
+        views.search_cache_stats_view,
+        name="search_cache_stats",
+    ),
+    path("imports/<int:job_id>/", views.import_job_view, name="import_job"),
     path("project_links/", views.get_project_sets_links, name="project_link_list"),
     path(
         "project_links/delete", views.delete_project_set_link, name="project_link_list"
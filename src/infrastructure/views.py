@@ -1,74 +1,137 @@
 import hashlib
 import json
+import os
+from collections import defaultdict
 
+import redis
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse, JsonResponse
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.http import FileResponse, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, render
 from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.decorators.http import require_http_methods
-from elasticsearch.helpers import bulk
 from rest_framework import generics
-from weasyprint import HTML
 
+from config import settings
 from config.logging import log
-from infrastructure.elastic import ProjectDocument
+from infrastructure.access_log import record_project_set_view
+from infrastructure.cache import (
+    get_cached_shared_page,
+    get_search_cache_stats,
+    set_cached_shared_page,
+)
+from infrastructure.counters import flush_filter_usage
+from infrastructure.imports import get_import_job_progress
+from infrastructure.outbox import enqueue_project_indexing
+from infrastructure.pdfs import get_pdf_path
 from infrastructure.models import (
     EmailStatus,
     FilterUsage,
+    ImportJob,
     Industry,
     Project,
     ProjectSet,
     ProjectSetLink,
-    ProjectSetLinkAccess,
     Technology,
 )
 from infrastructure.serializers import IndustrySerializer, TechnologySerializer
-from infrastructure.tasks import send_open_notification_email, send_shared_set_email
+from infrastructure.tasks import render_project_set_pdf, send_shared_set_email
 
 
 @login_required
 def download_pdf(request, project_set_id):
-    project_set = ProjectSet.objects.get(id=project_set_id)
+    project_set = get_object_or_404(ProjectSet, id=project_set_id)
+    version = project_set.get_content_version()
+    path = get_pdf_path(project_set.id, version)
+
+    if not os.path.exists(path):
+        # Rendered by a worker, only one render is queued per version of the set
+        if cache.add(
+            f"pdf:rendering:{project_set.id}:{version}",
+            1,
+            timeout=settings.PDF_RENDER_TIMEOUT,
+        ):
+            render_project_set_pdf.delay(project_set.id, version)
+        if not os.path.exists(path):
+            # The page reloads until the PDF is ready
+            return render(
+                request,
+                "sets/pdf_pending.html",
+                {"project_set": project_set},
+                status=202,
+            )
+
     project_set.increment_download_count()
-    html_string = render_to_string(
-        "sets/pdf_template.html", {"project_set": project_set}
+    return FileResponse(
+        open(path, "rb"),
+        as_attachment=True,
+        filename=f"{project_set.title}.pdf",
+        content_type="application/pdf",
     )
-    html = HTML(string=html_string)
-    response = HttpResponse(content_type="application/pdf")
-    response["Content-Disposition"] = f'attachment; filename="{project_set.title}.pdf"'
-    html.write_pdf(response)
-    return response
 
 
 @login_required
 @require_http_methods(["GET"])
 def get_project_sets_links(request):
-    project_sets = ProjectSet.objects.filter(user=request.user).prefetch_related("link")
-
-    project_sets_data = []
+    """
+    Return the links and email statuses of the user's project sets.
+    All sets are returned, unless a page is requested with ?page=<n>&size=<n>.
+    """
+    project_sets = (
+        ProjectSet.objects.filter(user=request.user)
+        .select_related("link")
+        .order_by("id")
+    )
 
-    for project_set in project_sets:
-        links = (
-            project_set.link.get_absolute_url() if hasattr(project_set, "link") else []
-        )
-        email_statuses = EmailStatus.objects.filter(project_set=project_set).values(
-            "recipient_email", "status"
-        )
-        project_sets_data.append(
-            {
-                "id": project_set.id,
-                "title": project_set.title,
-                "download_count": project_set.download_count,
-                "shared_link_count": project_set.shared_link_count,
-                "links": [links],
-                "email_statuses": list(email_statuses),
-            }
+    response_data = {"status": "success"}
+    if "page" in request.GET:
+        try:
+            size = int(request.GET.get("size", settings.DEFAULT_SIZE_PAGE))
+        except ValueError:
+            size = settings.DEFAULT_SIZE_PAGE
+        paginator = Paginator(
+            project_sets,
+            max(1, min(size, settings.PROJECT_SETS_LINKS_MAX_SIZE_PAGE)),
         )
+        page = paginator.get_page(request.GET.get("page"))
+        project_sets = page.object_list
+        response_data["pagination"] = {
+            "page": page.number,
+            "size": paginator.per_page,
+            "total": paginator.count,
+            "num_pages": paginator.num_pages,
+            "has_next": page.has_next(),
+        }
+
+    project_sets = list(project_sets)
+    # Statuses of all the sets in one query, grouped by set
+    email_statuses = defaultdict(list)
+    for email_status in EmailStatus.objects.filter(
+        project_set__in=project_sets
+    ).values("project_set_id", "recipient_email", "status"):
+        email_statuses[email_status.pop("project_set_id")].append(email_status)
 
-    return JsonResponse({"status": "success", "project_sets": project_sets_data})
+    response_data["project_sets"] = [
+        {
+            "id": project_set.id,
+            "title": project_set.title,
+            "download_count": project_set.download_count,
+            "shared_link_count": project_set.shared_link_count,
+            "links": (
+                [project_set.link.get_absolute_url()]
+                if hasattr(project_set, "link")
+                else []
+            ),
+            "email_statuses": email_statuses[project_set.id],
+        }
+        for project_set in project_sets
+    ]
+    return JsonResponse(response_data)
 
 
 @login_required
@@ -111,27 +174,32 @@ def share_to_email(request, project_set_id):
 
 class ProjectSetDetailView(View):
     def get(self, request, project_set_id):
-        link = get_object_or_404(ProjectSetLink, uuid=project_set_id)
-        project_set = link.project_set
+        project_set = get_object_or_404(ProjectSet, link__uuid=project_set_id)
 
         ip_address = request.META.get("REMOTE_ADDR")
         ip_address_hash = hashlib.sha256(ip_address.encode()).hexdigest()
-
-        access_record, created = ProjectSetLinkAccess.objects.get_or_create(
-            project_set=project_set,
-            ip_address_hash=ip_address_hash,
-        )
-
-        access_record.view_count += 1
-        access_record.save()
-
-        if created:
-            project_set.increment_shared_link_count()
-            send_open_notification_email.delay(
-                project_set.user.email, project_set.title
-            )
-
-        return render(request, "sets/set.html", {"project_set": project_set})
+        # Aggregated into ProjectSetLinkAccess periodically, the page writes nothing
+        record_project_set_view(project_set.id, ip_address_hash)
+
+        # The page is the same for every visitor, it only changes with the content.
+        # No Last-Modified, renamed tags of the projects have no timestamp.
+        version = project_set.get_content_version()
+        etag = f'"{version}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            content = get_cached_shared_page(project_set_id, version)
+            if content is None:
+                project_set = ProjectSet.objects.with_projects().get(id=project_set.id)
+                content = render_to_string(
+                    "sets/set.html", {"project_set": project_set}, request=request
+                )
+                set_cached_shared_page(project_set_id, version, content)
+            response = HttpResponse(content)
+
+        response.setdefault("ETag", etag)
+        # Browsers keep the page and revalidate it on every visit
+        patch_cache_control(response, no_cache=True)
+        return response
 
     @method_decorator(login_required)
     def delete(self, request, project_set_id):
@@ -157,8 +225,14 @@ class ProjectSetDetailView(View):
             )
 
         project_set.title = title
-        projects = Project.objects.filter(id__in=project_ids)
-        project_set.projects.set(projects)
+        # Projects already in the set are kept, the others are added as copies
+        kept_ids = set(
+            project_set.projects.filter(id__in=project_ids).values_list("id", flat=True)
+        )
+        project_set.projects.set(kept_ids)
+        project_set.add_projects(
+            Project.objects.filter(id__in=project_ids).exclude(id__in=kept_ids)
+        )
         project_set.save()
 
         return JsonResponse({"status": "success"})
@@ -199,10 +273,7 @@ def add_project(request):
         project.industries.add(industry)
 
     project.save()
-    bulk(
-        ProjectDocument._get_connection(),
-        [ProjectDocument.get_indexing_action(project)],
-    )
+    enqueue_project_indexing(request.user.id, [project.id])
     return JsonResponse(
         {
             "status": "success",
@@ -234,6 +305,7 @@ class ProjectView(View):
         project.technologies.set(Technology.objects.filter(id__in=technology_ids))
         project.industries.set(Industry.objects.filter(id__in=industry_ids))
         project.save()
+        enqueue_project_indexing(project.user_id, [project.id])
 
         log(
             "info",
@@ -246,7 +318,7 @@ class ProjectView(View):
         project = get_object_or_404(Project, pk=project_id)
         ProjectSet.objects.filter(projects__id=project_id).delete()
         project.delete()
-        ProjectDocument.get(id=project_id).delete()
+        enqueue_project_indexing(project.user_id, [project_id])
 
         log("info", f"User {request.user.email} deleted project {project.id}")
 
@@ -266,9 +338,7 @@ class ProjectSetView(View):
             )
 
         project_set = ProjectSet.objects.create(title=title, user=request.user)
-        projects = Project.objects.filter(id__in=project_ids)
-        project_set.projects.set(projects)
-        project_set.save()
+        project_set.add_projects(Project.objects.filter(id__in=project_ids))
 
         log(
             "info",
@@ -278,7 +348,7 @@ class ProjectSetView(View):
         return JsonResponse({"status": "success"})
 
     def get(self, request):
-        project_sets = ProjectSet.objects.filter(user=request.user)
+        project_sets = ProjectSet.objects.filter(user=request.user).with_projects()
         log("info", f"User {request.user.email} accessed project sets")
         return render(request, "sets/list_sets.html", {"project_sets": project_sets})
 
@@ -295,6 +365,12 @@ class TechnologyListView(generics.ListAPIView):
 
 @staff_member_required
 def popular_filters_view(request):
+    # Include the usage counted since the last periodic flush
+    try:
+        flush_filter_usage()
+    except redis.RedisError as e:
+        # E.g. a periodic flush holds the lock, the stored counts are shown
+        log(f"Failed to flush filter usage: {e}", "warning")
     popular_technologies = FilterUsage.objects.filter(
         filter_type="technology"
     ).order_by("-usage_count")[:10]
@@ -308,3 +384,22 @@ def popular_filters_view(request):
     }
 
     return render(request, "admin/popular_filters.html", context)
+
+
+@staff_member_required
+def search_cache_stats_view(request):
+    return JsonResponse({"status": "success", "stats": get_search_cache_stats()})
+
+
+@login_required
+@require_http_methods(["GET"])
+def import_job_view(request, job_id):
+    job = get_object_or_404(ImportJob, id=job_id)
+    if not request.user.is_staff and request.user.id not in (
+        job.created_by_id,
+        job.user_id,
+    ):
+        return JsonResponse(
+            {"status": "error", "message": "Import not found"}, status=404
+        )
+    return JsonResponse({"status": "success", "job": get_import_job_progress(job)})